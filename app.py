@@ -1,70 +1,80 @@
 import os
-import sqlite3
-from flask import Flask, render_template, jsonify
-import requests
+import time
+from collections import OrderedDict
+from flask import Blueprint, Flask, render_template, jsonify, request, Response, stream_with_context, g
 from datetime import datetime
+import hashlib
+import json
+import queue
+import threading
 import pytz
 
-app = Flask(__name__)
+from downsample import lttb, minmax_buckets
+from drinks import registry
+from log_config import setup_logging
+import metrics
+from price_cache import SnapshotCache
+from square_client import SquareClient
+import storage
+from snapshot import SnapshotBuilder
+from tick_stream import TickBroadcaster
+from webhooks import SIGNATURE_HEADER, WebhookIngester, verify_signature
+
+# Routes live on a blueprint; create_app() (below) builds the Flask app.
+# Importing this module opens no database connection and runs no DDL: the
+# schema is migrated lazily on first use (storage.ensure_schema).
+bp = Blueprint("dashboard", __name__)
 
 # ─── CONFIGURATION ─────────────────────────────────────────────────────────────
 PORT         = int(os.environ.get("PORT", 5000))
 ACCESS_TOKEN = os.getenv("SQUARE_ACCESS_TOKEN", "")
 LOCATION_ID  = os.getenv("SQUARE_LOCATION_ID", "")
-DB_PATH      = os.path.join(os.path.dirname(__file__), "price_history.db")
-
-# Keys here are the friendly display names; values are Square variation IDs.
-DRINKS = {
-    "Bud Light":      "3DQO6KCAEQPMPTZIHJ3HA3KP",
-    "Budweiser":      "SB723UTQLPRBLIIE27ZBGHZ7",
-    "Busch Light":    "SPUC5B5SGD7SXTYW3VSNVVAV",
-    "Coors Light":    "NO3AZ4JDPGQJYR23GZVFSAUA",
-    "Corona Light":   "J3QW2HGXZ2VFFYWXOHHCMFIK",
-    "Guinness":       "BUVRMGQPP347WIFSEVKLTYO6",
-    "Heineken":       "AXVZ5AHHXXJNW2MWHEHQKP2S",
-    "Michelob Ultra": "KAMYKBVWOHTPHREECKQONYZA",
-    "Miller Light":   "KAJM3ISSH2TYK7GGAJ2R4XF3",
-    "Modelo":         "ZTFUVEXIA5AF7TRKA322R3U3"
-}
-
-# Map display‐names → internal “underscored” keys for SQLite storage
-DISPLAY_TO_KEY = {
-    "Bud Light":      "bud_light",
-    "Budweiser":      "budweiser",
-    "Busch Light":    "busch_light",
-    "Coors Light":    "coors_light",
-    "Corona Light":   "corona_light",
-    "Guinness":       "guinness",
-    "Heineken":       "heineken",
-    "Michelob Ultra": "michelob_ultra",
-    "Miller Light":   "miller_light",
-    "Modelo":         "modelo"
-}
-
-# ─── ENSURE HISTORY TABLE EXISTS ────────────────────────────────────────────────
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
-c.execute("""
-CREATE TABLE IF NOT EXISTS history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp TEXT NOT NULL,
-    drink TEXT NOT NULL,
-    price REAL NOT NULL
-)
-""")
-# ─── ENSURE PURCHASES TABLE EXISTS ──────────────────────────────────────────────
-# (If you already have a purchases table, you can comment this out or drop/modify as needed.)
-c.execute("""
-CREATE TABLE IF NOT EXISTS purchases (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp TEXT NOT NULL,
-    drink TEXT NOT NULL,
-    quantity INTEGER NOT NULL,
-    price REAL NOT NULL
-)
-""")
-conn.commit()
-conn.close()
+# Seconds a Square price snapshot is served before it is refetched.
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", 10))
+# Seconds after the engine's last cycle before its prices count as stale
+# and Square's catalog is preferred again.
+LOCAL_PRICE_MAX_AGE = float(os.getenv("LOCAL_PRICE_MAX_AGE", 900))
+
+# The drink set lives in drinks.json (see drinks.py) and hot-reloads; these
+# are live read-only views, so lookups are O(1) and always current.
+DRINKS             = registry.view("variation_by_name")   # display name → Square variation id
+DISPLAY_TO_KEY     = registry.view("key_by_name")         # display name → storage key
+KEY_TO_DISPLAY     = registry.view("name_by_key")         # storage key → display name
+VARIATION_TO_DRINK = registry.view("name_by_variation")   # variation id → display name
+
+# Square webhook subscription (POST /webhooks/square).  The URL must be the
+# notification URL exactly as registered with Square: it is part of what is
+# signed.  Without a signature key the endpoint answers 404.
+WEBHOOK_SIGNATURE_KEY = os.getenv("SQUARE_WEBHOOK_SIGNATURE_KEY", "")
+WEBHOOK_URL           = os.getenv("SQUARE_WEBHOOK_URL", "")
+
+# Where /purchases reads from: "local" (the engine's purchases table) or "square".
+PURCHASES_SOURCE = os.getenv("PURCHASES_SOURCE", "local")
+MAX_PURCHASES    = 100
+# Upper bound for /history/<drink>?points= downsampling.
+MAX_HISTORY_POINTS = 2000
+# Default and maximum number of candles returned by /candles/<drink>
+DEFAULT_CANDLES = 300
+MAX_CANDLES     = 1000
+# Points of history per drink in the /snapshot cold-start document
+SNAPSHOT_HISTORY_POINTS = 300
+# Seconds between SSE keep-alive comments on an idle /stream connection.
+STREAM_KEEPALIVE = 15
+# Open /stream connections per worker before new ones get 503 and poll instead.
+# Each holds a gthread thread, so this must leave threads for every other
+# route (webhooks included); 0 = no limit (the ASGI mode needs none).
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", 48))
+
+# ─── METRICS (served at /metrics; per worker) ───────────────────────────────────
+HTTP_REQUESTS = metrics.Counter(
+    "http_requests_total", "Requests served, by route and status.", ("route", "method", "status"))
+HTTP_SECONDS = metrics.Histogram(
+    "http_request_seconds", "Time to produce a response (SSE: time to first byte).", ("route",))
+HISTORY_QUERY_SECONDS = metrics.Histogram(
+    "history_query_seconds", "SQLite time spent in /history/<drink>.", ("query",))
+
+# Pooled, keep-alive Square client (timeouts and retries built in)
+square = SquareClient(ACCESS_TOKEN)
 
 # ─── HELPERS ────────────────────────────────────────────────────────────────────
 def get_prices_from_square():
@@ -72,134 +82,524 @@ def get_prices_from_square():
     Fetch live prices from Square’s Catalog API.
     Returns a dict { "Bud Light": 4.15, … } on success.
     On error or missing token, returns {}.
+    Asks for our variation ids only (one ``catalog/batch-retrieve``); if that
+    fails, pages through the catalog and stops once every drink is found.
     """
     if not ACCESS_TOKEN:
         return {}
 
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
     try:
-        resp = requests.get(
-            "https://connect.squareupsandbox.com/v2/catalog/list",
-            headers=headers,
-            timeout=5
-        )
+        resp = square.post("/catalog/batch-retrieve", json={"object_ids": list(DRINKS.values())})
     except Exception:
-        return {}
+        resp = None
 
-    if resp.status_code != 200:
-        return {}
+    if resp is not None and resp.status_code == 200:
+        objects = resp.json().get("objects", [])
+    else:
+        objects = square.iter_catalog("ITEM_VARIATION")
 
     result = {}
-    for obj in resp.json().get("objects", []):
-        if obj.get("type") != "ITEM":
-            continue
-        for var in obj["item_data"].get("variations", []):
-            vid = var["id"]
-            for name, target_vid in DRINKS.items():
-                if vid == target_vid:
-                    cents = var["item_variation_data"]["price_money"]["amount"]
-                    result[name] = round(cents / 100.0, 2)
+    try:
+        for obj in objects:
+            name = VARIATION_TO_DRINK.get(obj.get("id"))
+            if name is None:
+                continue
+            cents = obj["item_variation_data"]["price_money"]["amount"]
+            result[name] = round(cents / 100.0, 2)
+            if len(result) == len(DRINKS):
+                break
+    except Exception:
+        return {}
     return result
 
 
+# Paid orders never change, so their parsed line items are kept per order id
+# and only orders we have never seen are fetched from Square.
+ORDER_CACHE_SIZE = 500
+_order_cache = OrderedDict()   # { order_id: [ {drink, quantity, price}, … ] }
+_order_cache_lock = threading.Lock()   # request threads (gthread, ASGI pool) share the cache
+
+
+def _parse_order_items(order):
+    """Return the tracked drinks in a Square order as display-ready dicts."""
+    items = []
+    for li in order.get("line_items", []):
+        vid = li.get("catalog_object_id")
+        qty = int(li.get("quantity", "1"))
+        price_cents = li.get("base_price_money", {}).get("amount", 0)
+        name = VARIATION_TO_DRINK.get(vid)
+        if name:
+            items.append({"drink": name, "quantity": qty, "price": round(price_cents / 100.0, 2)})
+    return items
+
+
+def _cached_orders(order_ids):
+    """Split ``order_ids`` into cached ``{order_id: items}`` and the ids still to fetch."""
+    found = {}
+    missing = []
+    with _order_cache_lock:
+        for oid in order_ids:
+            if oid in _order_cache:
+                _order_cache.move_to_end(oid)
+                found[oid] = _order_cache[oid]
+            elif oid not in missing:
+                missing.append(oid)
+    return found, missing
+
+
+def _orders_request(order_ids):
+    body = {"order_ids": order_ids}
+    if LOCATION_ID:
+        body["location_id"] = LOCATION_ID
+    return body
+
+
+def _remember_orders(orders, found):
+    """Parse fetched Square orders into ``found`` and the order cache."""
+    for order in orders:
+        oid = order.get("id")
+        if not oid:
+            continue
+        items = _parse_order_items(order)
+        found[oid] = items
+        with _order_cache_lock:
+            _order_cache[oid] = items
+            if len(_order_cache) > ORDER_CACHE_SIZE:
+                _order_cache.popitem(last=False)
+    return found
+
+
+def _payments_to_purchases(payments, orders, limit):
+    """Newest ``limit`` purchases from Square payments and their parsed orders."""
+    results = []
+    for pay in payments:
+        created = pay.get("created_at")
+        for item in orders.get(pay["order_id"], []):
+            results.append((created, item))
+
+    results.sort(key=lambda x: x[0], reverse=True)
+    return [r[1] for r in results[:limit]]
+
+
+def get_orders_from_square(order_ids):
+    """
+    Return ``{order_id: items}`` for ``order_ids``, serving cached orders
+    locally and fetching the rest with a single ``orders/batch-retrieve``.
+    Orders that could not be fetched are left out of the result.
+    """
+    found, missing = _cached_orders(order_ids)
+    if not missing:
+        return found
+
+    try:
+        resp = square.post("/orders/batch-retrieve", json=_orders_request(missing))
+    except Exception:
+        return found
+
+    if resp.status_code != 200:
+        return found
+    return _remember_orders(resp.json().get("orders", []), found)
+
+
 def get_recent_purchases_from_square(limit=10):
-    """Return the ``limit`` most recent purchases from Square."""
+    """
+    Return the ``limit`` most recent purchases from Square.
+    Costs one payments call plus at most one batched orders call.
+    """
     if not ACCESS_TOKEN:
         return []
 
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Square-Version": "2025-05-21",
-    }
     try:
-        resp = requests.get(
-            "https://connect.squareupsandbox.com/v2/payments",
-            headers=headers,
-            params={"sort_order": "DESC", "limit": limit},
-            timeout=5,
-        )
+        resp = square.get("/payments", params={"sort_order": "DESC", "limit": limit})
     except Exception:
         return []
 
     if resp.status_code != 200:
         return []
 
-    payments = resp.json().get("payments", [])
-    results = []
-    for pay in payments:
-        order_id = pay.get("order_id")
-        created = pay.get("created_at")
-        if not order_id:
-            continue
+    payments = [p for p in resp.json().get("payments", []) if p.get("order_id")]
+    orders = get_orders_from_square([p["order_id"] for p in payments])
+    return _payments_to_purchases(payments, orders, limit)
+
+
+async def get_recent_purchases_from_square_async(client, limit=10):
+    """``get_recent_purchases_from_square`` on an ``AsyncSquareClient`` (see asgi.py)."""
+    if not ACCESS_TOKEN:
+        return []
+
+    try:
+        resp = await client.get("/payments", params={"sort_order": "DESC", "limit": limit})
+    except Exception:
+        return []
+
+    if resp.status_code != 200:
+        return []
+
+    payments = [p for p in resp.json().get("payments", []) if p.get("order_id")]
+    orders, missing = _cached_orders([p["order_id"] for p in payments])
+    if missing:
         try:
-            oresp = requests.get(
-                f"https://connect.squareupsandbox.com/v2/orders/{order_id}",
-                headers=headers,
-                timeout=5,
-            )
+            resp = await client.post("/orders/batch-retrieve", json=_orders_request(missing))
+            if resp.status_code == 200:
+                _remember_orders(resp.json().get("orders", []), orders)
         except Exception:
-            continue
-        if oresp.status_code != 200:
-            continue
-        order = oresp.json().get("order", {})
-        for li in order.get("line_items", []):
-            vid = li.get("catalog_object_id")
-            qty = int(li.get("quantity", "1"))
-            price_cents = li.get("base_price_money", {}).get("amount", 0)
-            name = None
-            for disp, target_vid in DRINKS.items():
-                if vid == target_vid:
-                    name = disp
-                    break
-            if name:
-                results.append(
-                    (created, {"drink": name, "quantity": qty, "price": round(price_cents / 100.0, 2)})
-                )
+            pass
+    return _payments_to_purchases(payments, orders, limit)
 
-    results.sort(key=lambda x: x[0], reverse=True)
-    return [r[1] for r in results[:limit]]
+def get_recent_purchases_from_db(after=0, limit=10, day=None):
+    """
+    Return up to ``limit`` purchases recorded by the pricing engine with an
+    id greater than ``after``, newest first.  Defaults to the current market
+    day; walks the (market_day, id) index only.
+    """
+    c = storage.reader().cursor()
+    day = day or storage.current_market_day(c)
+    c.execute(
+        "SELECT id, timestamp, drink, quantity, price FROM purchases "
+        "WHERE market_day = ? AND id > ? ORDER BY id DESC LIMIT ?",
+        (day, after, limit)
+    )
+    return storage.purchase_dicts(c.fetchall(), KEY_TO_DISPLAY)
+
+# One Square catalog fetch per TTL for the whole box, shared by all workers.
+price_cache = SnapshotCache("prices", get_prices_from_square, ttl=PRICE_CACHE_TTL)
+
+def local_prices():
+    """
+    The engine's own prices (the ``latest_prices`` bus) by display name, as
+    ``(prices, fresh, need_square)``: Square is needed to fill drinks the
+    engine hasn't priced yet, or when it hasn't written for LOCAL_PRICE_MAX_AGE.
+    """
+    local = storage.latest_prices(storage.reader())
+    prices = {KEY_TO_DISPLAY[key]: row[0] for key, row in local.items() if key in KEY_TO_DISPLAY}
+    newest = max((row[2] for row in local.values()), default=None)
+    fresh = bool(newest) and (
+        datetime.now(tz=pytz.utc) - datetime.fromisoformat(newest)
+    ).total_seconds() < LOCAL_PRICE_MAX_AGE
+    return prices, fresh, not (fresh and len(prices) >= len(DRINKS))
+
+def merge_prices(prices, fresh, live):
+    """Combine local and Square (``live``) prices, in board order."""
+    if live is not None:
+        prices = {**live, **prices} if fresh else {**prices, **live}
+    return {name: prices[name] for name in DRINKS if name in prices}
+
+def get_current_prices():
+    """
+    Return { "Bud Light": 4.15, … } in board order.
+    The engine's own prices are used first; the cached Square catalog only
+    fills gaps or takes over when they are stale (see local_prices).
+    """
+    prices, fresh, need_square = local_prices()
+    return merge_prices(prices, fresh, price_cache.get(default={}) if need_square else None)
+
+# Cold-start document, rebuilt at most once per engine tick per worker.
+snapshot = SnapshotBuilder(
+    KEY_TO_DISPLAY,
+    current_prices=get_current_prices,
+    history_points=SNAPSHOT_HISTORY_POINTS,
+)
+
+# Pushes each engine tick to every /stream client connected to this worker.
+tick_stream = TickBroadcaster(KEY_TO_DISPLAY)
+
+# Write-behind queue from /webhooks/square into the purchases table.
+webhook_ingester = WebhookIngester(square)
 
 # ─── ROUTES ─────────────────────────────────────────────────────────────────────
-@app.route("/")
+@bp.before_app_request
+def reload_drinks():
+    # A monotonic-clock compare on most requests; a stat() every few seconds
+    registry.refresh()
+    start_webhook_writer()
+
+
+def start_webhook_writer():
+    """Drain the webhook inbox in this worker, including events left from before a restart."""
+    if WEBHOOK_SIGNATURE_KEY:
+        webhook_ingester.start()
+
+
+@bp.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def record_request(resp):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=resp.status_code)
+    started = g.get("request_started")
+    if started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, route=route)
+    return resp
+
+
+@metrics.collector
+def _cache_metrics():
+    stats = price_cache.stats()
+    return [
+        ("price_cache_events_total", "counter", "Price cache lookups and refreshes by outcome.",
+         {(event,): stats[event] for event in ("hits", "misses", "stale", "refreshes", "errors")},
+         ("event",)),
+        ("snapshot_builds_total", "counter", "/snapshot documents built by this worker.",
+         {(): snapshot.builds}, ()),
+        ("stream_subscribers", "gauge", "Open /stream connections on this worker.",
+         {(): tick_stream.subscriber_count()}, ()),
+        ("webhook_queue_depth", "gauge", "Square webhook events waiting to be written.",
+         {(): webhook_ingester.backlog()}, ()),
+    ]
+
+
+@bp.route("/")
 def index():
-    live = get_prices_from_square()
+    live = get_current_prices()
     if not live:
         return render_template("offline.html"), 503
     return render_template("index.html")
 
-@app.route("/prices")
+@bp.route("/prices")
 def prices_api():
-    return jsonify(get_prices_from_square())
+    return jsonify(get_current_prices())
+
+@bp.route("/snapshot")
+def snapshot_api():
+    """
+    Prices, directions, recent history for every drink and recent purchases
+    in one document, served pre-compressed from memory (see snapshot.py).
+    """
+    etag, bodies = snapshot.get()
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        accepted = request.accept_encodings
+        encoding = next(
+            (enc for enc in ("br", "gzip") if enc in bodies and accepted[enc]), "identity"
+        )
+        resp = Response(bodies[encoding], mimetype="application/json")
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+@bp.route("/cache/stats")
+def cache_stats_api():
+    """Hit/miss counters for this worker's caches."""
+    return jsonify({
+        price_cache.name: price_cache.stats(),
+        "snapshot": {"builds": snapshot.builds, "last_build_ms": snapshot.last_build_ms},
+    })
+
+@bp.route("/metrics")
+def metrics_api():
+    """Prometheus text exposition of this worker's counters and histograms."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route("/readyz")
+def readiness():
+    """200 once the database is at the current schema version, else 503."""
+    try:
+        storage.reader()
+        ready = storage.schema_ready()
+    except Exception:
+        ready = False
+    body = {"ready": ready, "schema_version": storage.SCHEMA_VERSION}
+    return jsonify(body), 200 if ready else 503
+
+@bp.route("/engine/status")
+def engine_status_api():
+    """One entry per location the pricing engine drives (see scheduler.py)."""
+    return jsonify(storage.engine_status(storage.reader()))
 
-@app.route("/history/<drink>")
+@bp.route("/history/<drink>")
 def history_api(drink):
     """
     Accepts display‐names like "Bud Light" and maps them to the underscore key 
     in the database. If unknown, returns 404 with [].
+
+    Optional query parameters:
+      • ?since=<timestamp>  only points strictly after this timestamp
+      • ?limit=<n>          only the most recent n points
+      • ?points=<n>         downsample to about n points (?mode=lttb|minmax)
+      • ?day=YYYY-MM-DD     a past market day still in the database (default: current)
+    Responses carry an ETag and Last-Modified so unchanged series come back as 304.
+    """
+    if drink not in DISPLAY_TO_KEY:
+        return jsonify([]), 404
+
+    key    = DISPLAY_TO_KEY[drink]
+    since  = request.args.get("since", "")
+    limit  = request.args.get("limit", 0, type=int)
+    points = min(request.args.get("points", 0, type=int), MAX_HISTORY_POINTS)
+    mode   = request.args.get("mode", "lttb")
+
+    c = storage.reader().cursor()
+    day = request.args.get("day") or storage.current_market_day(c)
+
+    # Cheap index-only probe: if the series has not changed, skip the read.
+    with HISTORY_QUERY_SECONDS.time(query="probe"):
+        c.execute(
+            "SELECT COUNT(*), MAX(timestamp) FROM history WHERE market_day = ? AND drink = ?",
+            (day, key)
+        )
+        count, last_ts = c.fetchone()
+    etag = hashlib.md5(
+        f"{key}|{day}|{count}|{last_ts}|{since}|{limit}|{points}|{mode}".encode()
+    ).hexdigest()
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+
+    with HISTORY_QUERY_SECONDS.time(query="rows"):
+        if limit > 0:
+            c.execute(
+                "SELECT timestamp, price FROM history "
+                "WHERE market_day = ? AND drink = ? AND timestamp > ? "
+                "ORDER BY timestamp DESC LIMIT ?",
+                (day, key, since, limit)
+            )
+            rows = c.fetchall()[::-1]
+        else:
+            c.execute(
+                "SELECT timestamp, price FROM history "
+                "WHERE market_day = ? AND drink = ? AND timestamp > ? "
+                "ORDER BY timestamp ASC",
+                (day, key, since)
+            )
+            rows = c.fetchall()
+
+    if points > 0:
+        rows = minmax_buckets(rows, points) if mode == "minmax" else lttb(rows, points)
+
+    history_data = [{"timestamp": ts, "price": price} for ts, price in rows]
+    resp = jsonify(history_data)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    if last_ts:
+        resp.last_modified = datetime.fromisoformat(last_ts)
+    return resp.make_conditional(request)
+
+@bp.route("/candles/<drink>")
+def candles_api(drink):
+    """
+    Pre-aggregated OHLCV candles for one drink, oldest first:
+      [ { "t": bucket_start, "o", "h", "l", "c", "v" }, … ]
+
+      • ?interval=1m|5m|15m   candle size (default 1m)
+      • ?limit=<n>            most recent n candles (default 300, max 1000)
+      • ?since=<bucket>       only candles starting at or after this bucket
+                              (the newest one may still be growing)
+      • ?day=YYYY-MM-DD       a past market day still in the database
     """
     if drink not in DISPLAY_TO_KEY:
         return jsonify([]), 404
+    interval = request.args.get("interval", "1m")
+    if interval not in storage.CANDLE_INTERVALS:
+        return jsonify({"error": f"interval must be one of {', '.join(storage.CANDLE_INTERVALS)}"}), 400
+
+    key   = DISPLAY_TO_KEY[drink]
+    since = request.args.get("since", "")
+    limit = min(max(request.args.get("limit", DEFAULT_CANDLES, type=int), 1), MAX_CANDLES)
 
-    key = DISPLAY_TO_KEY[drink]
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = storage.reader().cursor()
+    day = request.args.get("day") or storage.current_market_day(c)
     c.execute(
-        "SELECT timestamp, price FROM history WHERE drink = ? ORDER BY timestamp ASC",
-        (key,)
+        "SELECT bucket, open, high, low, close, volume FROM candles "
+        "WHERE market_day = ? AND drink = ? AND interval = ? AND bucket >= ? "
+        "ORDER BY bucket DESC LIMIT ?",
+        (day, key, storage.CANDLE_INTERVALS[interval], since, limit)
     )
-    rows = c.fetchall()
-    conn.close()
+    rows = c.fetchall()[::-1]
 
-    history_data = [{"timestamp": ts, "price": price} for ts, price in rows]
-    return jsonify(history_data)
+    # Buckets that only saw purchases (no price yet) carry no OHLC
+    return jsonify([
+        {"t": t, "o": o, "h": h, "l": l, "c": cl, "v": v}
+        for t, o, h, l, cl, v in rows if cl is not None
+    ])
 
-@app.route("/purchases")
+@bp.route("/purchases")
 def purchases_api():
-    """Return the most recent 10 purchases from Square."""
-    purchases = get_recent_purchases_from_square(limit=10)
-    return jsonify(purchases)
+    """
+    Return the most recent purchases, newest first.
+      • ?after=<id>   only purchases newer than the given id (client cursor)
+      • ?limit=<n>    at most n rows (default 10, max 100)
+      • ?day=YYYY-MM-DD a past market day still in the database (default: current)
+      • ?source=square  reconcile against Square instead of the local table
+    """
+    after = request.args.get("after", 0, type=int)
+    limit = min(max(request.args.get("limit", 10, type=int), 1), MAX_PURCHASES)
+    source = request.args.get("source", PURCHASES_SOURCE)
+
+    if source == "square":
+        return jsonify(get_recent_purchases_from_square(limit=limit))
+    day = request.args.get("day")
+    return jsonify(get_recent_purchases_from_db(after=after, limit=limit, day=day))
+
+@bp.route("/webhooks/square", methods=["POST"])
+def square_webhook():
+    """
+    Square ``payment.created`` / ``order.updated`` notifications.  Verified,
+    queued and acknowledged at once; the purchases are written in the
+    background (see webhooks.py) and reach dashboards with the next tick.
+    """
+    if not WEBHOOK_SIGNATURE_KEY:
+        return jsonify({"error": "webhooks are not configured"}), 404
+    body = request.get_data()
+    if not verify_signature(WEBHOOK_SIGNATURE_KEY, WEBHOOK_URL or request.url, body,
+                            request.headers.get(SIGNATURE_HEADER, "")):
+        return jsonify({"error": "invalid signature"}), 403
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return jsonify({"error": "malformed JSON"}), 400
+    if not isinstance(event, dict):
+        return jsonify({"error": "expected an event object"}), 400
+    if not webhook_ingester.submit(event):
+        return jsonify({"error": "busy, retry later"}), 503
+    return jsonify({"ok": True})
+
+@bp.route("/stream")
+def stream_api():
+    """
+    Server-Sent Events: one ``tick`` event per engine cycle carrying the new
+    prices and purchases, so dashboards don't have to poll.
+    """
+    q = tick_stream.subscribe(limit=STREAM_MAX_SUBSCRIBERS)
+    if q is None:
+        # Every stream holds a thread: past the cap the dashboard polls instead
+        resp = jsonify({"error": "too many streams, poll instead"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "60"
+        return resp
+
+    def events():
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                yield q.get(timeout=STREAM_KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+
+    resp = Response(stream_with_context(events()), mimetype="text/event-stream")
+    # Runs even if the client leaves before the first byte (the generator never started)
+    resp.call_on_close(lambda: tick_stream.unsubscribe(q))
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# ─── APP FACTORY ───────────────────────────────────────────────────────────────
+def create_app():
+    """Build the Flask app (cheap: safe to call in gunicorn's master with --preload)."""
+    setup_logging()
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app
 
 # ─── MAIN ──────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=PORT, debug=False)
+    create_app().run(host="0.0.0.0", port=PORT, debug=False)
 
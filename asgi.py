@@ -0,0 +1,141 @@
+"""
+ASGI entry point: many dashboards on a few workers.
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+    uvicorn asgi:app --port 5000
+
+The routes that wait run as coroutines on the event loop, so a slow Square
+response or an idle dashboard never holds a worker or a thread:
+
+  • /stream                   – SSE, one asyncio queue per connection
+  • /purchases?source=square  – Square calls on a pooled AsyncSquareClient
+  • /prices                   – local prices inline; a cold Square cache
+                                fill runs off the loop
+
+Everything else is the Flask app from app.py unchanged, run in asgiref's
+thread pool (WsgiToAsgi).  Needs the optional asgiref, httpx and uvicorn
+packages; wsgi.py keeps working without them.
+"""
+
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as web
+from drinks import registry
+from square_client import AsyncSquareClient
+
+flask_app = web.create_app()
+wsgi = WsgiToAsgi(flask_app)
+square = AsyncSquareClient(web.ACCESS_TOKEN)
+
+
+# ─── RESPONSES ─────────────────────────────────────────────────────────────────
+async def _send_json(send, payload, status=200):
+    body = flask_app.json.dumps(payload).encode("utf-8") + b"\n"
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+
+def _query(scope):
+    return {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+
+
+def _int_arg(args, name, default):
+    try:
+        return int(args.get(name, default))
+    except ValueError:
+        return default
+
+
+# ─── ASYNC ROUTES ──────────────────────────────────────────────────────────────
+async def prices(scope, receive, send):
+    local, fresh, need_square = web.local_prices()
+    live = None
+    if need_square:
+        # Usually an in-memory hit; only a cold cache waits for Square
+        live = await asyncio.to_thread(web.price_cache.get, default={})
+    return await _send_json(send, web.merge_prices(local, fresh, live))
+
+
+async def purchases(scope, receive, send):
+    args = _query(scope)
+    if args.get("source", web.PURCHASES_SOURCE) != "square":
+        return None   # the local table: Flask serves it
+    limit = min(max(_int_arg(args, "limit", 10), 1), web.MAX_PURCHASES)
+    return await _send_json(send, await web.get_recent_purchases_from_square_async(square, limit))
+
+
+async def stream(scope, receive, send):
+    sub = web.tick_stream.subscribe_async()
+    disconnected = asyncio.ensure_future(_until_disconnect(receive))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")],
+        })
+        message = "retry: 5000\n\n"
+        while not disconnected.done():
+            await send({"type": "http.response.body", "body": message.encode("utf-8"), "more_body": True})
+            getter = asyncio.ensure_future(sub.queue.get())
+            await asyncio.wait({getter, disconnected}, timeout=web.STREAM_KEEPALIVE,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                message = getter.result()
+            else:
+                getter.cancel()
+                message = ": keepalive\n\n"
+    finally:
+        web.tick_stream.unsubscribe(sub)
+        disconnected.cancel()
+    return 200
+
+
+async def _until_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+ROUTES = {"/prices": prices, "/purchases": purchases, "/stream": stream}
+
+
+# ─── APPLICATION ───────────────────────────────────────────────────────────────
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    handler = ROUTES.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "GET" else None
+    if handler is not None:
+        # What bp's before/after_app_request hooks do for Flask routes
+        registry.refresh()
+        started = time.perf_counter()
+        status = await handler(scope, receive, send)
+        if status is not None:
+            web.HTTP_REQUESTS.inc(route=scope["path"], method="GET", status=status)
+            if handler is not stream:
+                web.HTTP_SECONDS.observe(time.perf_counter() - started, route=scope["path"])
+            return
+    await wsgi(scope, receive, send)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            web.start_webhook_writer()   # in the worker, after any --preload fork
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await square.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
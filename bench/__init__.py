@@ -0,0 +1,6 @@
+"""
+Benchmarks and a local Square stand-in.  Run from the repository root:
+
+    python -m bench.fake_square --port 8099 --latency 0.05
+    python -m bench.run --dashboards 20 --duration 15
+"""
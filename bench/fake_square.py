@@ -0,0 +1,270 @@
+"""
+Local stand-in for the parts of the Square API this app calls.
+
+Routes (under /v2, same JSON shapes as Square):
+
+    GET  /catalog/list               ?types=ITEM_VARIATION|ITEM&cursor=…  (100 per page)
+    GET  /catalog/object/<id>
+    POST /catalog/batch-retrieve
+    POST /catalog/batch-upsert       VERSION_MISMATCH on stale versions
+    POST /orders
+    POST /orders/batch-retrieve
+    POST /payments
+    GET  /payments                   ?sort_order=DESC&limit=…
+
+Every tracked drink variation (from the drink registry) starts at
+``start_price`` and the catalog is padded with ``catalog_size`` filler
+variations.  ``latency`` (+ up to ``jitter``) seconds is added to every
+call and ``error_rate`` of calls answer HTTP 500.  POSTs honour
+``idempotency_key`` like Square does.
+
+    python -m bench.fake_square --port 8099 --latency 0.05 --error-rate 0.01
+    SQUARE_API_URL=http://127.0.0.1:8099/v2 python pricing_engine.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from drinks import registry
+
+PAGE_SIZE = 100
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _variation(vid, cents, name=None):
+    return {
+        "type": "ITEM_VARIATION",
+        "id": vid,
+        "version": 1,
+        "item_variation_data": {
+            "item_id": f"ITEM_{vid}",
+            "name": name or vid,
+            "pricing_type": "FIXED_PRICING",
+            "price_money": {"amount": cents, "currency": "USD"},
+        },
+    }
+
+
+class FakeSquare:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 catalog_size=0, variation_ids=None, start_price=5.00, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        variation_ids = list(variation_ids if variation_ids is not None else registry.view("variation_by_key").values())
+        self.catalog = {}   # id → object, in list order
+        for i in range(catalog_size):
+            vid = f"FILLER{i:08d}"
+            self.catalog[vid] = _variation(vid, 100 + i % 900)
+        for vid in variation_ids:
+            self.catalog[vid] = _variation(vid, int(round(start_price * 100)))
+        self.order_ids = {}      # id → order
+        self.payments = []       # newest last
+        self._idempotent = {}    # idempotency_key → (status, body)
+        self.calls = {}          # "METHOD /path" → count
+
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-square", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ─── ROUTES ────────────────────────────────────────────────────────────────
+    def handle(self, method, path, query, body):
+        """Return ``(status, json_body)`` for one call."""
+        if method == "GET" and path == "/catalog/list":
+            return self._catalog_list(query)
+        if method == "GET" and path.startswith("/catalog/object/"):
+            obj = self.catalog.get(path.rsplit("/", 1)[1])
+            return (200, {"object": obj}) if obj else _error(404, "NOT_FOUND", "Object not found")
+        if method == "POST" and path == "/catalog/batch-retrieve":
+            ids = body.get("object_ids", [])
+            return 200, {"objects": [self.catalog[i] for i in ids if i in self.catalog]}
+        if method == "POST" and path == "/catalog/batch-upsert":
+            return self._idempotent_call(body, self._batch_upsert)
+        if method == "POST" and path == "/orders":
+            return self._idempotent_call(body, self._create_order)
+        if method == "POST" and path == "/orders/batch-retrieve":
+            ids = body.get("order_ids", [])
+            return 200, {"orders": [self.order_ids[i] for i in ids if i in self.order_ids]}
+        if method == "POST" and path == "/payments":
+            return self._idempotent_call(body, self._create_payment)
+        if method == "GET" and path == "/payments":
+            limit = int(query.get("limit", ["100"])[0])
+            newest = self.payments[::-1] if query.get("sort_order", ["DESC"])[0] == "DESC" else self.payments
+            return 200, {"payments": newest[:limit]}
+        return _error(404, "NOT_FOUND", f"No fake for {method} {path}")
+
+    def _catalog_list(self, query):
+        types = set(query.get("types", ["ITEM,ITEM_VARIATION"])[0].split(","))
+        offset = int(query.get("cursor", ["0"])[0] or 0)
+        objects = list(self.catalog.values())[offset:offset + PAGE_SIZE]
+        page = []
+        for obj in objects:
+            if "ITEM_VARIATION" in types:
+                page.append(obj)
+            if "ITEM" in types:
+                page.append({"type": "ITEM", "id": obj["item_variation_data"]["item_id"],
+                             "item_data": {"name": obj["id"], "variations": [obj]}})
+        body = {"objects": page}
+        if offset + PAGE_SIZE < len(self.catalog):
+            body["cursor"] = str(offset + PAGE_SIZE)
+        return 200, body
+
+    def _idempotent_call(self, body, fn):
+        key = body.get("idempotency_key")
+        with self._lock:
+            if key and key in self._idempotent:
+                return self._idempotent[key]
+            result = fn(body)
+            if key:
+                self._idempotent[key] = result
+            return result
+
+    def _batch_upsert(self, body):
+        objects = [obj for batch in body.get("batches", []) for obj in batch.get("objects", [])]
+        errors = [
+            {"category": "INVALID_REQUEST_ERROR", "code": "VERSION_MISMATCH",
+             "detail": f"Object `{obj['id']}` was submitted with version {obj.get('version')}"}
+            for obj in objects
+            if obj["id"] in self.catalog and obj.get("version") != self.catalog[obj["id"]]["version"]
+        ]
+        if errors:
+            return 400, {"errors": errors}
+        saved = []
+        for obj in objects:
+            fresh = json.loads(json.dumps(obj))
+            fresh["version"] = self.catalog.get(obj["id"], {}).get("version", 0) + 1
+            fresh["updated_at"] = _now()
+            self.catalog[obj["id"]] = fresh
+            saved.append(fresh)
+        return 200, {"objects": saved, "updated_at": _now()}
+
+    def _create_order(self, body):
+        order = body.get("order", {})
+        line_items, total = [], 0
+        for li in order.get("line_items", []):
+            obj = self.catalog.get(li.get("catalog_object_id"))
+            if obj is None:
+                return _error(400, "NOT_FOUND", f"Unknown catalog object {li.get('catalog_object_id')}")
+            cents = obj["item_variation_data"]["price_money"]["amount"]
+            qty = int(li.get("quantity", "1"))
+            total += cents * qty
+            line_items.append({**li, "base_price_money": {"amount": cents, "currency": "USD"},
+                               "total_money": {"amount": cents * qty, "currency": "USD"}})
+        saved = {"id": uuid.uuid4().hex[:24].upper(), "location_id": order.get("location_id"),
+                 "reference_id": order.get("reference_id"),
+                 "line_items": line_items, "state": "OPEN", "created_at": _now(),
+                 "total_money": {"amount": total, "currency": "USD"}}
+        self.order_ids[saved["id"]] = saved
+        return 200, {"order": saved}
+
+    def _create_payment(self, body):
+        order = self.order_ids.get(body.get("order_id"))
+        if order is None:
+            return _error(400, "NOT_FOUND", "Unknown order")
+        order["state"] = "COMPLETED"
+        payment = {"id": uuid.uuid4().hex[:24].upper(), "order_id": order["id"],
+                   "location_id": body.get("location_id"), "status": "COMPLETED",
+                   "amount_money": body.get("amount_money"), "created_at": _now()}
+        self.payments.append(payment)
+        return 200, {"payment": payment}
+
+
+def _error(status, code, detail):
+    return status, {"errors": [{"category": "INVALID_REQUEST_ERROR", "code": code, "detail": detail}]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like Square
+    fake = None
+
+    def _serve(self, method):
+        url = urlparse(self.path)
+        path = url.path[len("/v2"):] if url.path.startswith("/v2") else url.path
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        fake = self.fake
+
+        with fake._lock:
+            route = f"{method} {path if not path.startswith('/catalog/object/') else '/catalog/object/:id'}"
+            fake.calls[route] = fake.calls.get(route, 0) + 1
+            delay = fake.latency + (fake._random.uniform(0, fake.jitter) if fake.jitter else 0)
+            fail = fake.error_rate and fake._random.random() < fake.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            status, body = _error(500, "INTERNAL_SERVER_ERROR", "Injected failure")
+            body["errors"][0]["category"] = "API_ERROR"
+        else:
+            try:
+                status, body = fake.handle(method, path, parse_qs(url.query), json.loads(raw or b"{}"))
+            except ValueError:
+                status, body = _error(400, "INVALID_REQUEST", "Malformed JSON")
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_POST(self):
+        self._serve("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Square API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds, uniform")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answering 500")
+    parser.add_argument("--catalog-size", type=int, default=0, help="filler variations in the catalog")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fake = FakeSquare(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, catalog_size=args.catalog_size, seed=args.seed)
+    print(f"Fake Square listening on {fake.url} ({len(fake.catalog)} catalog objects)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Benchmark the web tier and the pricing engine against the fake Square.
+
+Everything runs in one process on a throwaway database:
+
+  1. a fake Square (bench/fake_square.py) with the given latency/errors;
+  2. ``--seed-ticks`` engine cycles of history written straight to SQLite;
+  3. ``--cycles`` real engine cycles (LocationEngine.run_cycle) → cycle time;
+  4. the Flask app on a threaded local server, hit by ``--dashboards``
+     concurrent clients for ``--duration`` seconds → per-endpoint throughput
+     and p50/p95/p99 latency.
+
+Results are written as JSON (bench/results/<UTC time>.json by default).
+``--compare`` reads an earlier result and exits 1 if any p99 got slower or
+any throughput got lower by more than ``--tolerance``:
+
+    python -m bench.run --dashboards 20 --duration 15
+    python -m bench.run --compare bench/results/baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Endpoints one simulated dashboard polls, in order, per loop
+ENDPOINTS = ("/prices", "/history/{drink}?limit=300", "/purchases?limit=10")
+
+
+def _latency_summary(seconds, elapsed=None):
+    if not len(seconds):
+        return {"requests": 0}
+    ms = np.asarray(seconds) * 1000
+    pct = np.percentile(ms, [50, 95, 99])
+    out = {
+        "requests": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(pct[0]), 3),
+        "p95_ms": round(float(pct[1]), 3),
+        "p99_ms": round(float(pct[2]), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+    if elapsed:
+        out["rps"] = round(len(ms) / elapsed, 1)
+    return out
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _setup_env(args, workdir, fake_url):
+    """Point every module at the fake Square and a scratch DB before importing them."""
+    os.environ.update({
+        "SQUARE_API_URL": fake_url,
+        "SQUARE_ACCESS_TOKEN": "bench-token",
+        "SQUARE_LOCATION_ID": "BENCH_LOCATION",
+        "DB_PATH": os.path.join(workdir, "bench.db"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "LOCATIONS_CONFIG": os.path.join(workdir, "no-locations.json"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        "ENGINE_SEED": str(args.seed),
+    })
+
+
+def seed_history(ticks, keys, purchase_every=3, seed=0):
+    """Write ``ticks`` one-minute cycles of history/purchases ending now."""
+    import scheduler
+    import storage
+
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    day = scheduler.load_locations()[0].market_day(now)
+    prices = {k: 5.0 for k in keys}
+    for i in range(ticks):
+        ts = (now - timedelta(minutes=ticks - i)).isoformat()
+        for k in keys:
+            prices[k] = round(max(2.0, prices[k] * (1 + rnd.uniform(-0.05, 0.05))), 2)
+        purchases = []
+        if i % purchase_every == 0:
+            k = rnd.choice(keys)
+            qty = rnd.choice((1, 2, 3))
+            purchases.append((ts, k, qty, prices[k] * qty))
+        storage.record_cycle(day, [(ts, k, p) for k, p in prices.items()], purchases)
+
+
+def bench_engine(cycles):
+    import pricing_engine
+    import scheduler
+
+    location = scheduler.load_locations()[0]
+    engine = pricing_engine.LocationEngine(location, seed=0)
+    durations = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        engine.run_cycle(datetime.now(timezone.utc))
+        durations.append(time.perf_counter() - started)
+    return _latency_summary(durations)
+
+
+def bench_web(dashboards, duration, think):
+    import requests
+    from werkzeug.serving import make_server
+
+    import app as web
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # no access log per request
+    server = make_server("127.0.0.1", 0, web.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    drinks = list(web.DISPLAY_TO_KEY)
+
+    timings = {path: [] for path in ENDPOINTS}
+    errors = {path: 0 for path in ENDPOINTS}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def dashboard(i):
+        rnd = random.Random(i)
+        session = requests.Session()
+        mine = {path: [] for path in ENDPOINTS}
+        failed = {path: 0 for path in ENDPOINTS}
+        while time.perf_counter() < stop_at:
+            for path in ENDPOINTS:
+                url = base + path.format(drink=rnd.choice(drinks))
+                started = time.perf_counter()
+                try:
+                    ok = session.get(url, timeout=10).status_code < 400
+                except requests.RequestException:
+                    ok = False
+                mine[path].append(time.perf_counter() - started)
+                failed[path] += not ok
+            if think:
+                time.sleep(think)
+        with lock:
+            for path in ENDPOINTS:
+                timings[path] += mine[path]
+                errors[path] += failed[path]
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=dashboard, args=(i,)) for i in range(dashboards)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    out = {}
+    for path in ENDPOINTS:
+        out[path] = _latency_summary(timings[path], elapsed)
+        out[path]["errors"] = errors[path]
+    return out
+
+
+def compare(result, baseline, tolerance):
+    """Print a side-by-side table; return the regressions found."""
+    regressions = []
+    rows = [("engine cycle", baseline.get("engine", {}), result.get("engine", {}))]
+    rows += [(path, baseline.get("web", {}).get(path, {}), stats) for path, stats in result.get("web", {}).items()]
+    for name, old, new in rows:
+        for metric, worse_if_higher in (("p99_ms", True), ("rps", False)):
+            if metric not in old or metric not in new or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            flag = ""
+            if (change > tolerance) if worse_if_higher else (change < -tolerance):
+                flag = "  ← regression"
+                regressions.append(f"{name} {metric}")
+            print(f"  {name:<28} {metric:<7} {old[metric]:>10} → {new[metric]:>10} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dashboards", type=int, default=10, help="concurrent simulated dashboards")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of web load")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each dashboard waits per loop")
+    parser.add_argument("--seed-ticks", type=int, default=480, help="minutes of history to pre-load")
+    parser.add_argument("--cycles", type=int, default=20, help="engine cycles to time")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake Square latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--catalog-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="result file (default bench/results/<time>.json)")
+    parser.add_argument("--compare", help="earlier result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    from bench.fake_square import FakeSquare
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    fake = FakeSquare(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      catalog_size=args.catalog_size, seed=args.seed).start()
+    _setup_env(args, workdir, fake.url)
+
+    import storage
+    from drinks import registry
+
+    storage.ensure_schema()
+    print(f"Seeding {args.seed_ticks} ticks of history…")
+    seed_history(args.seed_ticks, registry.keys(), seed=args.seed)
+
+    print(f"Timing {args.cycles} engine cycles against {fake.url}…")
+    engine = bench_engine(args.cycles)
+    print(f"Loading the web tier with {args.dashboards} dashboards for {args.duration:g}s…")
+    web = bench_web(args.dashboards, args.duration, args.think)
+    fake.stop()
+
+    result = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_rev": _git_rev(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "engine": engine,
+        "web": web,
+        "square_calls": dict(sorted(fake.calls.items())),
+    }
+
+    print(f"  {'engine cycle':<28} p50 {engine['p50_ms']:>9} ms  p99 {engine['p99_ms']:>9} ms")
+    for path, stats in web.items():
+        print(f"  {path:<28} p50 {stats.get('p50_ms', '-'):>9} ms  p99 {stats.get('p99_ms', '-'):>9} ms  "
+              f"{stats.get('rps', 0):>8} req/s  {stats['errors']} errors")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (tolerance {args.tolerance:.0%}):")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
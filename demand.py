@@ -0,0 +1,60 @@
+"""
+Rolling demand per drink from exponentially decayed counters.
+
+Every window keeps one number per drink.  A sale decays it by
+``exp(-elapsed / window)`` since the drink's last update and adds the
+quantity, so recording a sale is O(1) and no sale is ever read twice.  At a
+steady pace a counter settles at the units sold in the last ``window``
+seconds, so ``rates()`` reports units/minute per window.
+
+The pricing engine adds each tick's purchases (simulated and, through the
+webhooks, real ones) and, on start, warms up from the purchases of the
+longest window with one indexed range read (storage.recent_purchases).
+simulate.py keeps the same counters as arrays, one set per night.
+Both turn rates into a price drift with ``demand_drift()``.
+"""
+
+import math
+
+import numpy as np
+
+import market
+
+# 5, 15 and 60 minutes: the short windows are compared with the last one
+DEMAND_WINDOWS = (300, 900, 3600)
+
+
+class DemandTracker:
+    def __init__(self, windows=DEMAND_WINDOWS):
+        self.windows = tuple(windows)
+        self._counts = {}    # { drink_key: [decayed units per window] }
+        self._updated = {}   # { drink_key: epoch seconds of that value }
+
+    def add(self, drink, qty, at):
+        """Record ``qty`` units of ``drink`` sold at ``at`` (epoch seconds)."""
+        self._counts[drink] = [count + qty for count in self._decayed(drink, at)]
+        self._updated[drink] = max(at, self._updated.get(drink, at))
+
+    def rates(self, drinks, at):
+        """Units/minute as an array of shape ``(len(drinks), len(windows))``."""
+        out = np.zeros((len(drinks), len(self.windows)))
+        for i, drink in enumerate(drinks):
+            out[i] = [count / window * 60 for count, window in zip(self._decayed(drink, at), self.windows)]
+        return out
+
+    def reset(self):
+        self._counts.clear()
+        self._updated.clear()
+
+    def _decayed(self, drink, at):
+        counts = self._counts.get(drink)
+        if counts is None:
+            return [0.0] * len(self.windows)
+        elapsed = max(at - self._updated[drink], 0.0)
+        return [count * math.exp(-elapsed / window) for count, window in zip(counts, self.windows)]
+
+
+def demand_drift(rates, params=market.DEFAULT_PARAMS):
+    """market.demand_drift() from ``rates()``: the short windows' mean pace against the longest."""
+    rates = np.asarray(rates)
+    return market.demand_drift(rates[..., :-1].mean(axis=-1), rates[..., -1], params)
@@ -0,0 +1,65 @@
+"""
+Downsampling helpers for price series.
+
+Both functions take a list of ``(timestamp, price)`` tuples in time order and
+return a shorter list of the same tuples.  Points are treated as evenly spaced
+(one per engine tick), so the x position of a point is simply its index.
+"""
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keep ``threshold`` points that best
+    preserve the visual shape of the line.  First and last points are kept.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # index of the previously selected point
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        span = next_end - next_start
+        avg_x = (next_start + next_end - 1) / 2.0
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / span
+
+        # Pick the point in this bucket with the largest triangle area
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = a, points[a][1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - j) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax_buckets(points, threshold):
+    """
+    Split the series into ``threshold // 2`` buckets and keep the lowest and
+    highest point of each, in time order.  Never hides a spike or a floor hit.
+    """
+    n = len(points)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return list(points)
+
+    size = n / buckets
+    sampled = []
+    for i in range(buckets):
+        chunk = range(int(i * size), int((i + 1) * size))
+        lo = min(chunk, key=lambda j: points[j][1])
+        hi = max(chunk, key=lambda j: points[j][1])
+        for j in sorted({lo, hi}):
+            sampled.append(points[j])
+    return sampled
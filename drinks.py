@@ -0,0 +1,224 @@
+"""
+Drink registry shared by the web tier and the pricing engine.
+
+Every drink is defined once in DRINKS_CONFIG (JSON)::
+
+    {"drinks": [{"key": "bud_light", "name": "Bud Light",
+                 "variation_id": "3DQO6KCAEQPMPTZIHJ3HA3KP",
+                 "params": {"target_price": 4.5}},      # optional, see market.py
+                …]}
+
+  • Lookups are dict hits in every direction (storage key, display name,
+    Square variation id).  ``view()`` hands out read-only mappings that
+    always see the latest load, so modules can keep module-level names like
+    ``KEY_TO_DISPLAY``.
+  • ``refresh()`` re-reads the file when its mtime/size changes (checked at
+    most every RELOAD_CHECK_SECONDS) and returns only the keys that were
+    added, removed or edited.  A file that fails to parse is reported and
+    the previous registry stays in use.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+
+import numpy as np
+
+import market
+
+log = logging.getLogger("drinks")
+
+DRINKS_CONFIG = os.getenv("DRINKS_CONFIG", os.path.join(os.path.dirname(__file__), "drinks.json"))
+RELOAD_CHECK_SECONDS = float(os.getenv("DRINKS_RELOAD_SECONDS", 5))
+
+_PARAM_FIELDS = {f.name for f in fields(market.MarketParams)}
+
+
+@dataclass(frozen=True)
+class Drink:
+    key: str
+    name: str
+    variation_id: str
+    params: dict = field(default_factory=dict, compare=True, hash=False)
+
+
+class _Index:
+    """One immutable load of the registry; swapped as a whole on reload."""
+
+    def __init__(self, drinks, stamp):
+        self.stamp = stamp
+        self.by_key = {d.key: d for d in drinks}
+        self.name_by_key = {d.key: d.name for d in drinks}
+        self.key_by_name = {d.name: d.key for d in drinks}
+        self.variation_by_key = {d.key: d.variation_id for d in drinks}
+        self.variation_by_name = {d.name: d.variation_id for d in drinks}
+        self.name_by_variation = {d.variation_id: d.name for d in drinks}
+        self.key_by_variation = {d.variation_id: d.key for d in drinks}
+        self._params = {}
+
+
+class _View(Mapping):
+    """Read-only mapping over one index of the current load."""
+
+    def __init__(self, registry, index):
+        self._registry = registry
+        self._index = index
+
+    def _map(self):
+        return getattr(self._registry._current, self._index)
+
+    def __getitem__(self, key):
+        return self._map()[key]
+
+    def __iter__(self):
+        return iter(self._map())
+
+    def __len__(self):
+        return len(self._map())
+
+    def __contains__(self, key):
+        return key in self._map()
+
+    def get(self, key, default=None):
+        return self._map().get(key, default)
+
+    # Each reads one load's (never mutated) dict, so a reload mid-loop can't
+    # make the Mapping mixins' per-key lookups raise KeyError
+    def keys(self):
+        return self._map().keys()
+
+    def items(self):
+        return self._map().items()
+
+    def values(self):
+        return self._map().values()
+
+    def __repr__(self):
+        return f"<drinks {self._index}: {self._map()!r}>"
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load(path):
+    """Parse a registry file into a list of ``Drink``; raises ValueError if invalid."""
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+
+    drinks, seen = [], set()
+    for entry in raw.get("drinks", []):
+        try:
+            key, name, vid = entry["key"], entry["name"], entry["variation_id"]
+        except KeyError as e:
+            raise ValueError(f"drink entry missing {e}: {entry!r}") from None
+        params = dict(entry.get("params") or {})
+        unknown = set(params) - _PARAM_FIELDS
+        if unknown:
+            raise ValueError(f"{key}: unknown pricing params {sorted(unknown)}")
+        for ident in (key, name, vid):
+            if ident in seen:
+                raise ValueError(f"duplicate drink identifier {ident!r}")
+            seen.add(ident)
+        drinks.append(Drink(key, name, vid, params))
+    return drinks
+
+
+class DrinkRegistry:
+    def __init__(self, path=DRINKS_CONFIG, check_interval=RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._current = _Index(load(path), _stamp(path))
+        self._failed_stamp = None
+        self._next_check = time.monotonic() + check_interval
+
+    # ─── LOOKUPS ───────────────────────────────────────────────────────────────
+    def view(self, index):
+        """A live mapping such as ``view("name_by_key")``; see ``_Index``."""
+        getattr(self._current, index)   # fail fast on a typo
+        return _View(self, index)
+
+    def get(self, key):
+        return self._current.by_key.get(key)
+
+    def keys(self):
+        return list(self._current.by_key)
+
+    def __len__(self):
+        return len(self._current.by_key)
+
+    def market_params(self, keys):
+        """
+        ``market.MarketParams`` for drinks ``keys`` (in that order), with
+        per-drink overrides as arrays.  Cached per load and key order.
+        """
+        index = self._current
+        keys = tuple(keys)
+        params = index._params.get(keys)
+        if params is None:
+            overrides = {}
+            for name in _PARAM_FIELDS:
+                if any(name in index.by_key[k].params for k in keys if k in index.by_key):
+                    default = getattr(market.DEFAULT_PARAMS, name)
+                    overrides[name] = np.array([
+                        index.by_key[k].params.get(name, default) if k in index.by_key else default
+                        for k in keys
+                    ], dtype=float)
+            params = market.MarketParams(**overrides) if overrides else market.DEFAULT_PARAMS
+            index._params[keys] = params
+        return params
+
+    # ─── HOT RELOAD ────────────────────────────────────────────────────────────
+    def refresh(self, force=False):
+        """
+        Reload if the file changed.  Returns the set of keys added, removed
+        or edited (empty when nothing changed or the check was skipped).
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return set()
+        with self._lock:
+            self._next_check = now + self.check_interval
+            stamp = None
+            try:
+                stamp = _stamp(self.path)
+                if not force and stamp in (self._current.stamp, self._failed_stamp):
+                    return set()
+                drinks = load(self.path)
+            except (OSError, ValueError) as e:
+                # Reported once per bad version of the file
+                self._failed_stamp = stamp
+                log.error("Keeping previous registry; reload failed: %s", e)
+                return set()
+
+            old = self._current.by_key
+            fresh = _Index(drinks, stamp)
+            changed = {k for k in old.keys() | fresh.by_key.keys()
+                       if old.get(k) != fresh.by_key.get(k)}
+            self._current = fresh
+        if changed:
+            log.info("Reloaded %d drinks; changed: %s", len(fresh.by_key), ", ".join(sorted(changed)))
+        return changed
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def registry_for(path=None):
+    """The shared registry for a config file (one per path per process)."""
+    path = os.path.abspath(path or DRINKS_CONFIG)
+    with _registries_lock:
+        reg = _registries.get(path)
+        if reg is None:
+            reg = _registries[path] = DrinkRegistry(path)
+        return reg
+
+
+registry = registry_for()
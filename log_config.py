@@ -0,0 +1,53 @@
+"""
+Logging setup shared by the web tier and the pricing engine.
+
+  LOG_LEVEL   DEBUG | INFO (default) | WARNING | ERROR
+  LOG_FORMAT  text (default) | json — one JSON object per line, with any
+              ``extra={…}`` fields passed to the logger kept as keys
+
+Square response bodies are only logged at DEBUG, so they stay out of
+pricing_engine.log unless someone asks for them.
+"""
+
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL  = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        doc.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str, ensure_ascii=False)
+
+
+def setup_logging(level=None, fmt=None):
+    """Configure the root logger once per process (later calls are no-ops)."""
+    root = logging.getLogger()
+    if getattr(root, "_configured_by_app", False):
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if (fmt or LOG_FORMAT) == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.handlers[:] = [handler]
+    root.setLevel(level or LOG_LEVEL)
+    root._configured_by_app = True
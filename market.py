@@ -0,0 +1,168 @@
+"""
+Vectorized market dynamics shared by the live pricing engine and the
+offline simulator (simulate.py).
+
+Prices are NumPy arrays whose last axis is the drink; any leading axes are
+independent markets (e.g. thousands of simulated nights).  All randomness
+comes from the ``numpy.random.Generator`` passed in, so a seeded run is
+exactly reproducible.
+
+Each tick:
+  1) Random walk: ±RANDOM_RANGE (uniform fraction of the price)
+  2) Purchase drift (+0.01 * qty) or no‐purchase drift (−0.01), plus the
+     demand drift from rolling sales windows, if given (demand_drift())
+  3) Pull toward TARGET_PRICE with α from alpha_to_center()
+  4) Enforce floor at FLOOR_PRICE
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+# === PRICING PARAMETERS ===
+FLOOR_PRICE    = 2.00
+RANDOM_RANGE   = 0.10    # ±10% random walk component
+
+# Mean–reversion to $5 parameters
+TARGET_PRICE   = 5.00
+PRICE_LOW      = 2.00
+PRICE_HIGH     = 10.00
+# Mean reversion aggressiveness has been reduced so prices revert more gently
+# at the extreme bands.  All previous α values are halved.
+ALPHA_AT_LOW   = 0.125   # α when price <= 2.00
+ALPHA_AT_MID   = 0.005   # α when price = 5.00
+ALPHA_AT_HIGH  = 0.125   # α when price >= 10.00
+
+# Purchase drift per unit sold, and the flat drift when nothing sells
+PURCHASE_DRIFT    = 0.01
+NO_PURCHASE_DRIFT = -0.01
+
+# Demand drift: at most ±DEMAND_WEIGHT per tick, by how much faster (or
+# slower) a drink sold in the short windows than over the long one.  Long-run
+# paces below DEMAND_FLOOR_RATE units/minute count as that rate.
+DEMAND_WEIGHT     = 0.01
+DEMAND_FLOOR_RATE = 0.1
+
+# Quantity of a simulated purchase and its weights
+PURCHASE_QTYS    = np.array([1, 2, 3])
+PURCHASE_WEIGHTS = np.array([0.6, 0.25, 0.15])
+
+
+@dataclass
+class MarketParams:
+    """Tunable parameters; each field may be a float or a per-drink array."""
+    floor_price: float = FLOOR_PRICE
+    random_range: float = RANDOM_RANGE
+    target_price: float = TARGET_PRICE
+    price_low: float = PRICE_LOW
+    price_high: float = PRICE_HIGH
+    alpha_at_low: float = ALPHA_AT_LOW
+    alpha_at_mid: float = ALPHA_AT_MID
+    alpha_at_high: float = ALPHA_AT_HIGH
+    demand_weight: float = DEMAND_WEIGHT
+    demand_floor_rate: float = DEMAND_FLOOR_RATE
+
+
+DEFAULT_PARAMS = MarketParams()
+
+
+def make_rng(seed=None):
+    """Return a Generator; ``seed`` may be None, an int, or a numeric string."""
+    if isinstance(seed, str):
+        seed = int(seed) if seed.strip() else None
+    return np.random.default_rng(seed)
+
+
+def purchase_prob(prices, params=DEFAULT_PARAMS):
+    """Probability in [0,1] per drink where $2 → 1 and $10 → 0 (linear between)."""
+    prices = np.asarray(prices, dtype=float)
+    p = 1.0 - (prices - params.price_low) / (params.price_high - params.price_low)
+    return np.clip(p, 0.0, 1.0)
+
+
+def alpha_to_center(prices, params=DEFAULT_PARAMS):
+    """
+    Compute α for pulling each price toward the target:
+      • α = alpha_at_low  at price <= price_low
+      • α = alpha_at_mid  at price  = target_price
+      • α = alpha_at_high at price >= price_high
+    Linearly interpolated in between.
+    """
+    prices = np.asarray(prices, dtype=float)
+    lo = np.clip(prices, params.price_low, params.target_price)
+    hi = np.clip(prices, params.target_price, params.price_high)
+    below = params.alpha_at_low - (lo - params.price_low) * (
+        params.alpha_at_low - params.alpha_at_mid) / (params.target_price - params.price_low)
+    above = params.alpha_at_mid + (hi - params.target_price) * (
+        params.alpha_at_high - params.alpha_at_mid) / (params.price_high - params.target_price)
+    return np.where(prices < params.target_price, below, above)
+
+
+def choose_purchases(prices, rng, params=DEFAULT_PARAMS):
+    """
+    Simulate at most one purchase per market.
+
+    A drink is picked with weight purchase_prob(price); the purchase then
+    happens with that same probability, so cheap drinks sell more often.
+    Returns an int array shaped like ``prices`` holding the quantity bought
+    (0 for every drink that was not bought).
+    """
+    prices = np.asarray(prices, dtype=float)
+    flat = np.atleast_2d(prices)
+    m, n = flat.shape
+
+    probs = purchase_prob(flat, params)
+    totals = probs.sum(axis=1)
+    cum = np.cumsum(probs, axis=1)
+    pick = np.minimum((cum <= (rng.random(m) * totals)[:, None]).sum(axis=1), n - 1)
+
+    rows = np.arange(m)
+    accept = (totals > 0) & (rng.random(m) < probs[rows, pick])
+    qty = rng.choice(PURCHASE_QTYS, size=m, p=PURCHASE_WEIGHTS)
+
+    out = np.zeros((m, n), dtype=int)
+    out[rows[accept], pick[accept]] = qty[accept]
+    return out.reshape(prices.shape)
+
+
+def demand_drift(short_rate, long_rate, params=DEFAULT_PARAMS):
+    """
+    Drift from rolling demand (units/minute, see demand.DemandTracker):
+    positive while a drink sells faster than its long-run pace, negative
+    while it sells slower; tanh keeps one rush from running away.
+    """
+    short_rate = np.asarray(short_rate, dtype=float)
+    long_rate = np.asarray(long_rate, dtype=float)
+    pace = np.maximum(long_rate, params.demand_floor_rate)
+    return params.demand_weight * np.tanh((short_rate - long_rate) / pace)
+
+
+def step(prices, qty, rng, params=DEFAULT_PARAMS, demand=0.0):
+    """
+    Advance every price one tick given the quantity bought of each drink and
+    an optional per-drink ``demand`` drift (demand_drift()).
+    """
+    prices = np.asarray(prices, dtype=float)
+    qty = np.asarray(qty)
+
+    # 1) Random walk component (a uniform fraction in [−R, +R])
+    rand_comp = rng.uniform(-1.0, 1.0, size=prices.shape) * params.random_range
+
+    # 2) Purchase vs. no‐purchase drift, plus recent demand
+    drift = np.where(qty > 0, PURCHASE_DRIFT * qty, NO_PURCHASE_DRIFT) + demand
+
+    # Construct preliminary price
+    new_prices = prices * (1 + rand_comp + drift)
+
+    # 3) Mean‐reversion directly toward the target
+    new_prices += (params.target_price - new_prices) * alpha_to_center(new_prices, params)
+
+    # 4) Enforce floor
+    new_prices = np.maximum(new_prices, params.floor_price)
+
+    return np.round(new_prices, 2)
+
+
+def update_streaks(streaks, qty):
+    """Consecutive ticks without a purchase, per drink."""
+    return np.where(np.asarray(qty) > 0, 0, np.asarray(streaks) + 1)
@@ -0,0 +1,187 @@
+"""
+Minimal Prometheus-style metrics shared by the web tier and the engine.
+
+Counters and histograms live in this process's memory and are rendered in
+the Prometheus text format by ``render()`` — served at ``/metrics`` by
+app.py and by ``serve()`` in the engine (ENGINE_METRICS_PORT).  Every
+gunicorn worker keeps its own numbers; scrape each worker (or sum them)
+the same way ``/cache/stats`` is per worker.
+
+    SQUARE_SECONDS.observe(0.12, method="POST", endpoint="/orders")
+    with HISTORY_QUERY_SECONDS.time(query="rows"):
+        …
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; tuned for Square calls, SQLite queries and engine cycles alike
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+_lock = threading.Lock()
+
+
+def _label_str(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, (counts, total, sum_) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = _label_str(self.labelnames, key, [("le", repr(float(bound)))])
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                inf = _label_str(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{inf} {total}")
+                labels = _label_str(self.labelnames, key)
+                lines.append(f"{self.name}_count{labels} {total}")
+                lines.append(f"{self.name}_sum{labels} {round(sum_, 6)}")
+        return lines
+
+
+def collector(fn):
+    """
+    Register ``fn() -> [(name, kind, help, {labels tuple: value}, labelnames)]``
+    for values owned elsewhere (e.g. cache hit counters); read at scrape time.
+    """
+    with _lock:
+        _collectors.append(fn)
+    return fn
+
+
+def render():
+    """Every metric in this process, in the Prometheus text format."""
+    with _lock:
+        metrics, collectors = list(_metrics), list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for fn in collectors:
+        try:
+            families = fn()
+        except Exception:   # a broken collector must not break the scrape
+            continue
+        for name, kind, help, values, labelnames in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_label_str(labelnames, key)} {value}" for key, value in values.items()]
+    return "\n".join(lines) + "\n"
+
+
+# ─── SHARED METRICS ────────────────────────────────────────────────────────────
+SQUARE_SECONDS = Histogram(
+    "square_request_seconds", "Square API call latency, retries included.", ("method", "endpoint"))
+SQUARE_RESPONSES = Counter(
+    "square_responses_total", "Square API calls by final HTTP status (or 'error').",
+    ("method", "endpoint", "status"))
+
+
+# ─── ENGINE-SIDE EXPORTER ──────────────────────────────────────────────────────
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):   # scrapes are not worth a log line
+        pass
+
+
+def serve(port=None, host="0.0.0.0"):
+    """
+    Serve ``/metrics`` from a daemon thread (for processes without Flask).
+    ``port`` defaults to ENGINE_METRICS_PORT; 0 or unset disables it.
+    Returns the server, or None when disabled.
+    """
+    port = int(os.getenv("ENGINE_METRICS_PORT", 0) if port is None else port)
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
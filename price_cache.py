@@ -0,0 +1,157 @@
+"""
+Shared snapshot cache used by the web tier in front of slow upstream calls.
+
+Every gunicorn worker keeps the last snapshot in memory, so a fresh hit costs
+one dict lookup.  Snapshots are also written to a small JSON file under
+``CACHE_DIR`` so that all workers on the box share one copy:
+
+  • TTL            – a snapshot older than ``ttl`` seconds is a miss.
+  • Refresh-ahead  – once a snapshot is ``refresh_ahead`` of the way through
+                     its TTL it is still served, but a background refresh is
+                     started so readers rarely see a miss.
+  • Single-flight  – a thread lock (per worker) plus an ``flock`` on a lock
+                     file (across workers) make sure only one caller refetches.
+  • Serve-stale    – if the loader fails or returns nothing, the previous
+                     snapshot keeps being served and the failure is counted.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
+
+
+class SnapshotCache:
+    def __init__(self, name, loader, ttl=10.0, refresh_ahead=0.8, cache_dir=CACHE_DIR):
+        self.name = name
+        self.loader = loader
+        self.ttl = float(ttl)
+        self.refresh_after = self.ttl * refresh_ahead
+        self.path = os.path.join(cache_dir, f"{name}.json")
+        self.lock_path = self.path + ".lock"
+
+        self._value = None
+        self._fetched_at = 0.0
+        self._file_mtime = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "refreshes": 0, "errors": 0}
+
+    # ─── PUBLIC API ────────────────────────────────────────────────────────────
+    def get(self, default=None):
+        """Return the cached snapshot, refreshing it if it is stale or missing."""
+        age = time.time() - self._fetched_at
+        if self._value is not None and age < self.refresh_after:
+            self._stats["hits"] += 1
+            return self._value
+
+        # Our copy is getting old: another worker may already have refreshed it.
+        self._load_shared()
+        age = time.time() - self._fetched_at
+
+        if self._value is not None and age < self.ttl:
+            self._stats["hits"] += 1
+            if age >= self.refresh_after:
+                self._refresh_in_background()
+            return self._value
+
+        self._stats["misses"] += 1
+        self._refresh(wait=self._value is None)
+        if self._value is None:
+            return default
+        if time.time() - self._fetched_at >= self.ttl:
+            self._stats["stale"] += 1
+        return self._value
+
+    def stats(self):
+        """Per-process counters plus the age of the snapshot currently held."""
+        out = dict(self._stats)
+        out["age"] = round(time.time() - self._fetched_at, 3) if self._value is not None else None
+        return out
+
+    # ─── INTERNALS ─────────────────────────────────────────────────────────────
+    def _load_shared(self):
+        """Adopt the shared snapshot file if another worker has written a newer one."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        self._file_mtime = mtime
+        if data.get("fetched_at", 0.0) > self._fetched_at:
+            self._value = data.get("value")
+            self._fetched_at = data["fetched_at"]
+
+    def _write_shared(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=f".{self.name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump({"fetched_at": self._fetched_at, "value": self._value}, fh)
+            os.replace(tmp, self.path)
+            self._file_mtime = os.stat(self.path).st_mtime
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _refresh_in_background(self):
+        if self._lock.locked():
+            return
+        threading.Thread(target=self._refresh, kwargs={"wait": False}, daemon=True).start()
+
+    def _refresh(self, wait):
+        """
+        Refetch the snapshot, with at most one caller per box doing the work.
+        Callers that already hold a (stale) value never wait; callers with
+        nothing to serve block until whoever holds the lock has finished.
+        """
+        # Back off after an upstream failure instead of retrying on every request.
+        if not wait and time.time() - self._failed_at < self.ttl:
+            return
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            # Created on first use so constructing a cache touches no files
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.lock_path, "a") as lock_fh:
+                try:
+                    fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if not wait:
+                        return
+                    fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    # Someone else may have refreshed while we waited for the lock.
+                    self._load_shared()
+                    if self._value is not None and time.time() - self._fetched_at < self.refresh_after:
+                        return
+                    self._fetch()
+                finally:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def _fetch(self):
+        self._stats["refreshes"] += 1
+        try:
+            value = self.loader()
+        except Exception:
+            value = None
+        if not value:
+            self._stats["errors"] += 1
+            self._failed_at = time.time()
+            return
+        self._value = value
+        self._fetched_at = time.time()
+        self._write_shared()
@@ -1,385 +1,518 @@
+import logging
 import os
 import sys
-import time
+import threading
 import uuid
-import random
-import requests
-import sqlite3
 from datetime import datetime, timedelta
+import numpy as np
 import pytz
 
+import market
+import metrics
+from market import TARGET_PRICE
+from demand import DemandTracker, demand_drift
+from drinks import registry_for
+from log_config import setup_logging
+import scheduler
+from square_client import ENGINE_ORDER_REFERENCE, SquareClient, SQUARE_API_URL
+import storage
+
+log = logging.getLogger("pricing_engine")
+
 # === CONFIGURATION ===
-SQUARE_API_URL = "https://connect.squareupsandbox.com/v2"
+# Checked in run_engine(), so importing this module (bench/, a REPL) has no
+# side effects; the database schema is migrated lazily (storage.ensure_schema).
 ACCESS_TOKEN   = os.getenv("SQUARE_ACCESS_TOKEN")
-LOCATION_ID    = os.getenv("SQUARE_LOCATION_ID")
-
-# === EARLY TOKEN & LOCATION CHECK ===
-if not ACCESS_TOKEN:
-    print("[DEBUG] SQUARE_ACCESS_TOKEN is empty! Exiting.")
-    sys.exit(1)
-
-if not LOCATION_ID:
-    print("⚠️ SQUARE_LOCATION_ID is empty! (Set this in your Render environment.)")
-    sys.exit(1)
-
-# === DATABASE SETUP (SQLite) ===
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, "price_history.db")
-
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
-c.execute("""
-CREATE TABLE IF NOT EXISTS history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp TEXT NOT NULL,
-    drink TEXT NOT NULL,
-    price REAL NOT NULL
-)
-""")
-c.execute("""
-CREATE TABLE IF NOT EXISTS purchases (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp TEXT NOT NULL,
-    drink TEXT NOT NULL,
-    quantity INTEGER NOT NULL,
-    price REAL NOT NULL
-)
-""")
-conn.commit()
-conn.close()
-
-# === HEADERS (with pinned API version) ===
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Square-Version": "2025-05-21",
-    "Content-Type": "application/json"
-}
-
-DRINKS = {
-    "bud_light":        "3DQO6KCAEQPMPTZIHJ3HA3KP",
-    "budweiser":        "SB723UTQLPRBLIIE27ZBGHZ7",
-    "busch_light":      "SPUC5B5SGD7SXTYW3VSNVVAV",
-    "coors_light":      "NO3AZ4JDPGQJYR23GZVFSAUA",
-    "corona_light":     "J3QW2HGXZ2VFFYWXOHHCMFIK",
-    "guinness":         "BUVRMGQPP347WIFSEVKLTYO6",
-    "heineken":         "AXVZ5AHHXXJNW2MWHEHQKP2S",
-    "michelob_ultra":   "KAMYKBVWOHTPHREECKQONYZA",
-    "miller_light":     "KAJM3ISSH2TYK7GGAJ2R4XF3",
-    "modelo":           "ZTFUVEXIA5AF7TRKA322R3U3"
-}
-
-# === PRICING PARAMETERS ===
-FLOOR_PRICE    = 2.00
-RANDOM_RANGE   = 0.10    # ±10% random walk component
-
-# Mean–reversion to $5 parameters
-TARGET_PRICE   = 5.00
-PRICE_LOW      = 2.00
-PRICE_HIGH     = 10.00
-# Mean reversion aggressiveness has been reduced so prices revert more gently
-# at the extreme bands.  All previous α values are halved.
-ALPHA_AT_LOW   = 0.125   # α when price <= 2.00
-ALPHA_AT_MID   = 0.005   # α when price = 5.00
-ALPHA_AT_HIGH  = 0.125   # α when price >= 10.00
-
-# Track consecutive no‐purchase streaks (for potential logging; drift is flat −0.01)
-no_purchase_streak = { drink: 0 for drink in DRINKS }
-
-# US/Eastern timezone for active‐hours logic
-EASTERN = pytz.timezone("US/Eastern")
-
-
-def get_square_price(variation_id, drink):
-    url = f"{SQUARE_API_URL}/catalog/object/{variation_id}"
-    resp = requests.get(url, headers=HEADERS)
-    print(f"[{drink}] GET {url} → HTTP {resp.status_code}")
-    print(f"[{drink}]   Response: {resp.text}")
-
-    if resp.status_code == 200:
-        data = resp.json()
-        cents = data["object"]["item_variation_data"]["price_money"]["amount"]
-        return cents / 100.0
-    else:
-        raise RuntimeError(f"[{drink}] Failed to fetch price: HTTP {resp.status_code}")
-
-
-def update_square_price(drink, variation_id, new_price):
-    cents = int(round(new_price * 100))
-
-    # Fetch the full catalog object for upsert
-    url_get = f"{SQUARE_API_URL}/catalog/object/{variation_id}"
-    resp = requests.get(url_get, headers=HEADERS)
-    print(f"[{drink}] GET for upsert ({url_get}) → HTTP {resp.status_code}")
-    print(f"[{drink}]   Pre-upsert: {resp.text}")
 
-    if resp.status_code != 200:
-        print(f"[{drink}] ❌ Failed to fetch object before upsert (HTTP {resp.status_code})")
-        return
-
-    catalog_object = resp.json()["object"]
-    catalog_object["item_variation_data"]["price_money"]["amount"] = cents
-
-    body = {
-        "idempotency_key": str(uuid.uuid4()),
-        "batches": [
-            {"objects": [catalog_object]}
-        ]
-    }
-    url_post = f"{SQUARE_API_URL}/catalog/batch-upsert"
-    upsert_resp = requests.post(url_post, headers=HEADERS, json=body)
-    print(f"[{drink}] POST {url_post} → HTTP {upsert_resp.status_code}")
-    print(f"[{drink}]   Upsert: {upsert_resp.text}")
-
-    if upsert_resp.status_code == 200:
-        print(f"[{drink}] ✅ Price updated to ${new_price:.2f}")
-    else:
-        print(f"[{drink}] ❌ Failed to update price: HTTP {upsert_resp.status_code}")
-
-
-def purchase_prob(price: float) -> float:
-    """Return a probability in [0,1] where $2 → 1 and $10 → 0."""
-    if price <= PRICE_LOW:
-        return 1.0
-    if price >= PRICE_HIGH:
-        return 0.0
-    return 1.0 - (price - PRICE_LOW) / (PRICE_HIGH - PRICE_LOW)
-
-
-def simulate_real_square_purchase(prices: dict) -> dict:
-    """Simulate a purchase using current prices.
-
-    The chance of purchasing a drink decreases linearly as its price
-    approaches $10 and increases as it nears $2.  At $10 no purchase
-    occurs and at $2 a purchase always occurs.
-    Returns ``{drink_key: quantity}`` or ``{}`` if no purchase happens.
-    """
-    if not prices:
-        print("[none] No purchase this cycle")
-        return {}
+# === SQUARE CLIENT (pooled session, pinned API version, timeouts, retries) ===
+square = SquareClient(ACCESS_TOKEN)
 
-    drink_keys = list(prices.keys())
-    weights = [purchase_prob(prices[d]) for d in drink_keys]
-    if sum(weights) == 0:
-        print("[none] No purchase this cycle")
-        return {}
+# Drinks, trading hours, tick interval and random stream are per location
+# (scheduler.Location / LocationEngine); pricing parameters live in market.py
+# with per-drink overrides in drinks.json.
 
-    drink_key = random.choices(drink_keys, weights=weights)[0]
-    p = purchase_prob(prices[drink_key])
-    if random.random() > p:
-        print("[none] No purchase this cycle")
-        return {}
+# batch-upsert attempts per cycle when Square reports a version conflict
+MAX_UPSERT_ATTEMPTS = 3
 
-    qty = random.choices([1, 2, 3], weights=[0.6, 0.25, 0.15])[0]
-    variation_id = DRINKS[drink_key]
-    print(f"[{drink_key}] Simulating {qty} purchase(s)…")
-
-    # Record purchase time (for logging; not used in drift)
-    now_utc = datetime.now(tz=pytz.utc)
-    last_purchase_time = now_utc  # (unused aside from potential logs)
-
-    # Create Order
-    order_url = f"{SQUARE_API_URL}/orders"
-    order_body = {
-        "order": {
-            "location_id": LOCATION_ID,
-            "line_items": [
-                {
-                    "catalog_object_id": variation_id,
-                    "quantity": str(qty)
-                }
-            ]
-        },
-        "idempotency_key": str(uuid.uuid4())
-    }
-    order_resp = requests.post(order_url, headers=HEADERS, json=order_body)
-    print(f"  [Order] POST {order_url} → HTTP {order_resp.status_code}")
-    print(f"  [Order]   Body: {order_resp.text}")
-
-    if order_resp.status_code not in (200, 201):
-        print(f"  [{drink_key}] ❌ Unable to create Square order (HTTP {order_resp.status_code})")
-        return {}
+# After a restart, replay the ticks missed since the last checkpoint (same
+# market day only) so the chart has no gap; at most this many per restart.
+ENGINE_CATCH_UP    = os.getenv("ENGINE_CATCH_UP", "1").lower() not in ("0", "false", "no", "")
+MAX_CATCH_UP_TICKS = int(os.getenv("MAX_CATCH_UP_TICKS", 600))
 
-    order_data = order_resp.json().get("order", {})
-    order_id   = order_data.get("id")
-    total_cents = order_data.get("total_money", {}).get("amount", 0)
-    if not order_id or total_cents is None:
-        print(f"  [{drink_key}] ❌ Invalid order_id or total_money.")
-        return {}
-
-    # Create Payment
-    payment_url = f"{SQUARE_API_URL}/payments"
-    payment_body = {
-        "source_id": "cnon:card-nonce-ok",
-        "idempotency_key": str(uuid.uuid4()),
-        "amount_money": {
-            "amount": total_cents,
-            "currency": "USD"
-        },
-        "order_id": order_id,
-        "location_id": LOCATION_ID
-    }
-    pay_resp = requests.post(payment_url, headers=HEADERS, json=payment_body)
-    print(f"  [Payment] POST {payment_url} → HTTP {pay_resp.status_code}")
-    print(f"  [Payment]   Body: {pay_resp.text}")
-
-    if pay_resp.status_code not in (200, 201):
-        print(f"  [{drink_key}] ❌ Unable to pay order.")
-        return {drink_key: qty}
+# Real (webhook) sales count toward a tick's purchase drift only if they were
+# rung up during that tick, and at most this many units per drink per tick.
+MAX_REAL_SALES_PER_TICK = int(os.getenv("MAX_REAL_SALES_PER_TICK", 3))
 
-    print(f"[{drink_key}] ✔️ Order {order_id} paid for ${total_cents/100:.2f}")
 
-    # Record purchase locally so the dashboard can display history
+def get_square_objects(variation_ids):
+    """
+    Fetch the full catalog objects (including ``version``) for
+    ``variation_ids`` with a single ``catalog/batch-retrieve`` call.
+    Returns ``{variation_id: object}``; ids Square did not return are absent.
+    """
+    url = f"{SQUARE_API_URL}/catalog/batch-retrieve"
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c    = conn.cursor()
-        now_ts = datetime.now(tz=pytz.utc).isoformat()
-        c.execute(
-            "INSERT INTO purchases (timestamp, drink, quantity, price) VALUES (?, ?, ?, ?)",
-            (now_ts, drink_key, qty, total_cents / 100.0)
-        )
-        conn.commit()
-        conn.close()
+        resp = square.post("/catalog/batch-retrieve", json={"object_ids": list(variation_ids)})
     except Exception as e:
-        print(f"  [{drink_key}] ⚠️ Failed to record purchase locally: {e}")
+        log.error("catalog batch-retrieve failed: %s", e)
+        return {}
+    log.info("POST %s (%d ids) → HTTP %s", url, len(variation_ids), resp.status_code)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("catalog batch-retrieve response: %s", resp.text)
 
-    return {drink_key: qty}
+    if resp.status_code != 200:
+        return {}
+    return {obj["id"]: obj for obj in resp.json().get("objects", []) if obj.get("id")}
 
 
-def alpha_to_center(price: float) -> float:
+def get_square_prices(drinks):
+    """
+    Read every drink's current price in one call.
+    Returns ``(prices, objects)``: ``{drink: price}`` for drinks Square
+    returned, and ``{drink: catalog_object}`` to reuse for the upsert.
     """
-    Compute α for pulling price toward TARGET_PRICE (5.00):
-      • α = 0.125 at price <= 2.00
-      • α = 0.005 at price = 5.00
-      • α = 0.125 at price >= 10.00
-    Linearly interpolate for intermediate values.
+    by_id = get_square_objects(drinks.values())
+    prices, objects = {}, {}
+    for drink, variation_id in drinks.items():
+        obj = by_id.get(variation_id)
+        if obj is None:
+            log.warning("[%s] Error retrieving price: not returned by batch-retrieve", drink)
+            continue
+        cents = obj["item_variation_data"]["price_money"]["amount"]
+        prices[drink] = cents / 100.0
+        objects[drink] = obj
+    return prices, objects
+
+
+def _conflicting_ids(errors, variation_ids):
+    """Variation ids named in Square's VERSION_MISMATCH errors."""
+    ids = set()
+    for err in errors:
+        if err.get("code") != "VERSION_MISMATCH":
+            continue
+        text = f"{err.get('detail', '')} {err.get('field', '')}"
+        ids.update(vid for vid in variation_ids if vid in text)
+    return ids
+
+
+def update_square_prices(new_prices, objects):
+    """
+    Write new prices back to Square in a single ``catalog/batch-upsert``,
+    reusing the objects (and versions) read at the start of the cycle.
+    Drinks whose price (in cents) did not change are left out of the batch.
+    A batch is applied atomically, so every tick's change lands all at once.
+
+    On a version conflict only the conflicting objects are re-read, then the
+    whole batch is retried, up to MAX_UPSERT_ATTEMPTS times in total.
     """
-    if price <= PRICE_LOW:
-        return ALPHA_AT_LOW
-    elif price >= PRICE_HIGH:
-        return ALPHA_AT_HIGH
-    elif price < TARGET_PRICE:
-        # Map [2.0 → 5.0] → [0.125 → 0.005]
-        return ALPHA_AT_LOW - (price - PRICE_LOW) * (ALPHA_AT_LOW - ALPHA_AT_MID) / (TARGET_PRICE - PRICE_LOW)
-    else:
-        # Map [5.0 → 10.0] → [0.005 → 0.125]
-        return ALPHA_AT_MID + (price - TARGET_PRICE) * (ALPHA_AT_HIGH - ALPHA_AT_MID) / (PRICE_HIGH - TARGET_PRICE)
-
-
-def apply_pricing_logic(drink: str, current_price: float, purchases: dict):
+    pending = {}
+    for drink, new_price in new_prices.items():
+        obj = objects.get(drink)
+        if obj is None:
+            log.warning("[%s] No catalog object to update; skipping", drink)
+            continue
+        money = obj["item_variation_data"]["price_money"]
+        cents = int(round(new_price * 100))
+        if money.get("amount") == cents:
+            continue
+        money["amount"] = cents
+        pending[obj["id"]] = obj
+    if not pending:
+        return False
+
+    url = f"{SQUARE_API_URL}/catalog/batch-upsert"
+    for attempt in range(1, MAX_UPSERT_ATTEMPTS + 1):
+        body = {
+            "idempotency_key": str(uuid.uuid4()),
+            "batches": [
+                {"objects": list(pending.values())}
+            ]
+        }
+        try:
+            resp = square.post("/catalog/batch-upsert", json=body)
+        except Exception as e:
+            log.error("Failed to update prices: %s", e)
+            return False
+        log.info("POST %s (%d objects) → HTTP %s", url, len(pending), resp.status_code)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("catalog batch-upsert response: %s", resp.text)
+
+        if resp.status_code == 200:
+            log.info("Updated %d prices", len(pending))
+            return True
+
+        try:
+            errors = resp.json().get("errors", [])
+        except ValueError:
+            errors = []
+        conflicts = _conflicting_ids(errors, pending)
+        if not conflicts or attempt == MAX_UPSERT_ATTEMPTS:
+            log.error("Failed to update prices: HTTP %s", resp.status_code)
+            return False
+
+        # Someone else edited these items: take their new versions, keep our prices
+        log.warning("Version conflict on %d object(s); retrying", len(conflicts))
+        fresh = get_square_objects(conflicts)
+        for vid in conflicts:
+            if vid not in fresh:
+                pending.pop(vid)
+                continue
+            cents = pending[vid]["item_variation_data"]["price_money"]["amount"]
+            fresh[vid]["item_variation_data"]["price_money"]["amount"] = cents
+            pending[vid] = fresh[vid]
+        if not pending:
+            return False
+    return False
+
+
+class LocationEngine:
     """
-    1) Random walk: ±10%
-    2) Purchase drift (+0.01 * qty) or no‐purchase drift (−0.01)
-    3) Pull directly toward $5.00 with α defined by alpha_to_center()
-    4) Enforce floor at $2.00
+    One location's market: its drink registry, random stream, database file
+    and per-drink state.  ``scheduler.Scheduler`` calls ``run_cycle()`` once
+    per tick while the location is open and ``on_close()`` when it closes.
+
+    Every cycle checkpoints the engine state (last tick, prices, streaks and
+    the random stream) to the ``engine_state`` table in the same transaction
+    as its history, and a new engine resumes from that checkpoint.
+
+    Demand over the last 5/15/60 minutes (demand.DemandTracker) is kept
+    incrementally from each tick's purchases and nudges every price step.
     """
-    # 1) Random walk component (a uniform fraction in [−0.10, +0.10])
-    rand_comp = random.uniform(-RANDOM_RANGE, RANDOM_RANGE)
-
-    # 2) Purchase vs. no‐purchase drift
-    if drink in purchases:
-        qty = purchases[drink]
-        purchase_comp = 0.01 * qty
-        no_purchase_streak[drink] = 0
-    else:
-        purchase_comp = -0.01
-        no_purchase_streak[drink] += 1
-
-    # Construct preliminary price
-    new_price = current_price * (1 + rand_comp + purchase_comp)
-
-    # 3) Mean‐reversion directly toward $5.00
-    alpha = alpha_to_center(new_price)
-    new_price += (TARGET_PRICE - new_price) * alpha
-
-    # 4) Enforce floor at $2.00
-    if new_price < FLOOR_PRICE:
-        new_price = FLOOR_PRICE
-
-    return round(new_price, 2)
-
-
-def seconds_until_next_4pm_eastern():
-    now_utc = datetime.now(tz=pytz.utc)
-    now_eastern = now_utc.astimezone(EASTERN)
-
-    today_4pm = EASTERN.localize(datetime(
-        now_eastern.year, now_eastern.month, now_eastern.day, 16, 0, 0
-    ))
-    if now_eastern < today_4pm:
-        next_start = today_4pm
-    else:
-        tomorrow = now_eastern.date() + timedelta(days=1)
-        next_start = EASTERN.localize(datetime(
-            tomorrow.year, tomorrow.month, tomorrow.day, 16, 0, 0
-        ))
-    next_start_utc = next_start.astimezone(pytz.utc)
-    return max((next_start_utc - now_utc).total_seconds(), 0)
+
+    def __init__(self, location, seed=None):
+        self.location = location
+        self.registry = registry_for(location.drinks_config)
+        self.drinks = self.registry.view("variation_by_key")   # storage key → variation id
+        self.rng = market.make_rng(seed)
+        self.no_purchase_streak = {}   # { drink_key: ticks }
+        self.market_day = None
+        self.sales_cursor = None       # newest purchases.id already fed into the market
+        self._sales_floor = None       # start of the first tick this session/process counts sales for
+        self.demand = DemandTracker()
+        self._demand_day = None        # market day the demand counters were warmed for
+        self._maintenance = None
+        storage.ensure_schema(location.db_path)
+        self._checkpoint = storage.load_engine_state(location.name, location.db_path)
+        if self._checkpoint:
+            self.restore(self._checkpoint)
+
+    def restore(self, checkpoint):
+        """Resume streaks, market day, sales cursor and the random stream from a checkpoint."""
+        self.market_day = checkpoint["market_day"]
+        self.sales_cursor = checkpoint.get("sales_cursor")
+        self.no_purchase_streak.update(checkpoint.get("streaks", {}))
+        try:
+            self.rng.bit_generator.state = checkpoint["rng"]
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning("[%s] Not restoring the random stream: %s", self.location.name, e)
+        log.info("[%s] Resuming from checkpoint at %s (market day %s)",
+                 self.location.name, checkpoint["last_tick_at"], self.market_day)
+
+    def checkpoint(self, last_tick_at, prices):
+        """The ``record_cycle(checkpoint=…)`` triple for the state after a tick."""
+        return (self.location.name, last_tick_at, {
+            "prices": prices,
+            "streaks": self.no_purchase_streak,
+            "rng": self.rng.bit_generator.state,
+            "sales_cursor": self.sales_cursor,
+        })
+
+    def catch_up(self, now_utc):
+        """
+        Fill the ticks missed since the checkpoint, if it is from today's market
+        day: each missed tick is replayed as a no-purchase market step on the
+        checkpointed random stream (so the same checkpoint always produces the
+        same prices) and stored at the time it should have run.
+        Returns the caught-up ``{drink_key: price}``, or ``{}``.
+        """
+        loc, checkpoint, self._checkpoint = self.location, self._checkpoint, None
+        market_day = loc.market_day(now_utc)
+        if not checkpoint or checkpoint["market_day"] != market_day:
+            return {}
+        last = datetime.fromisoformat(checkpoint["last_tick_at"])
+        tick = timedelta(seconds=loc.tick_seconds)
+        missed = min(int((now_utc - last) / tick) - 1, MAX_CATCH_UP_TICKS)   # the tick due now runs live
+        keys = [d for d in checkpoint["prices"] if d in self.drinks]
+        if missed <= 0 or not keys:
+            return {}
+
+        prices = np.array([checkpoint["prices"][d] for d in keys])
+        zero = np.zeros(len(keys), dtype=int)
+        params = self.registry.market_params(keys)
+        streaks = np.array([self.no_purchase_streak.get(d, 0) for d in keys])
+        history_rows = []
+        for i in range(1, missed + 1):
+            at = last + i * tick
+            prices = market.step(prices, zero, self.rng, params, self.demand_drift(keys, at, params))
+            ts = at.isoformat()
+            history_rows += [(ts, d, float(p)) for d, p in zip(keys, prices)]
+        self.no_purchase_streak.update(zip(keys, (streaks + missed).tolist()))
+
+        caught_up = {d: float(p) for d, p in zip(keys, prices)}
+        storage.record_cycle(market_day, history_rows, path=loc.db_path,
+                             checkpoint=self.checkpoint(ts, caught_up))
+        log.info("[%s] Caught up %d missed tick(s) since %s", loc.name, missed, checkpoint["last_tick_at"])
+        return caught_up
+
+    def run_cycle(self, now_utc):
+        """Price every drink once and record the cycle."""
+        loc = self.location
+        # A new market day is just a new partition value: nothing is deleted
+        market_day = loc.market_day(now_utc)
+        if market_day != self.market_day:
+            self.market_day = market_day
+            log.info("[%s] Opening market day %s", loc.name, market_day)
+
+        # Pick up drinks.json edits; only the drinks that changed need resetting
+        for drink in self.registry.refresh():
+            self.no_purchase_streak.pop(drink, None)
+
+        # Demand counters start from this session's recent purchases (indexed)
+        if self._demand_day != market_day:
+            self.warm_demand(market_day, now_utc)
+
+        # 0) First cycle after a restart: replay the ticks we slept through
+        caught_up = {}
+        if self._checkpoint is not None and ENGINE_CATCH_UP:
+            try:
+                caught_up = self.catch_up(now_utc)
+            except Exception as e:
+                log.error("[%s] Catch-up failed, resuming without it: %s", loc.name, e)
+        self._checkpoint = None
+
+        # 1) Fetch current prices for all drinks (one batch-retrieve);
+        #    our own last published price beats the target if Square misses one,
+        #    and caught-up prices beat Square (which still has the pre-restart ones)
+        square_prices, catalog_objects = get_square_prices(self.drinks)
+        published = storage.latest_prices(storage.writer(loc.db_path))
+        current_prices = {
+            drink: caught_up.get(drink) or square_prices.get(
+                drink, published.get(drink, (self.target_price(drink),))[0])
+            for drink in self.drinks
+        }
+
+        # 2) Simulate purchases using those prices, plus the real sales Square
+        #    reported (webhooks → purchases) since the last tick
+        purchase_rows = []
+        purchases = self.simulate_purchase(current_prices, purchase_rows)
+        for drink, qty in self.real_sales(now_utc).items():
+            if drink in current_prices:
+                purchases[drink] = purchases.get(drink, 0) + qty
+        for drink, qty in purchases.items():
+            self.demand.add(drink, qty, now_utc.timestamp())
+
+        # 3) For each drink compute new price, then update Square (one batch-upsert)
+        new_prices = self.apply_pricing_logic(current_prices, purchases, now_utc)
+        update_square_prices(new_prices, catalog_objects)
+
+        # 4) Store the cycle's history, purchases and checkpoint in one transaction,
+        #    stamped with the scheduled tick time like market_day and catch-up rows
+        now_ts = now_utc.isoformat()
+        try:
+            storage.record_cycle(
+                market_day,
+                [(now_ts, drink, new_price) for drink, new_price in new_prices.items()],
+                purchase_rows,
+                path=loc.db_path,
+                checkpoint=self.checkpoint(now_ts, new_prices),
+            )
+        except Exception as e:
+            log.error("[%s] Failed to record history/purchases: %s", loc.name, e)
+
+    def real_sales(self, now_utc):
+        """
+        ``{drink_key: units}`` sold through Square since the last tick, capped
+        at MAX_REAL_SALES_PER_TICK per drink.  A sale stored late (written
+        after its tick's read, or retried out of the webhook inbox) still
+        counts on the next tick; only sales from before this session opened
+        or this engine started move the cursor without being counted, so
+        they never land on one tick all at once.
+        """
+        conn = storage.writer(self.location.db_path)
+        if self._sales_floor is None:
+            self._sales_floor = (now_utc - timedelta(seconds=self.location.tick_seconds)).isoformat()
+        if self.sales_cursor is None:
+            # First start: earlier sales were never part of this market
+            self.sales_cursor = storage.max_purchase_id(conn)
+            return {}
+        sold, self.sales_cursor = storage.square_sales_since(conn, self.sales_cursor, self._sales_floor)
+        return {drink: min(qty, MAX_REAL_SALES_PER_TICK) for drink, qty in sold.items()}
+
+    def warm_demand(self, market_day, now_utc):
+        """Rebuild the demand counters from the longest window's purchases."""
+        self.demand.reset()
+        since = (now_utc - timedelta(seconds=max(self.demand.windows))).isoformat()
+        conn = storage.writer(self.location.db_path)
+        for pid, ts, drink, qty, source in storage.recent_purchases(conn, market_day, since):
+            if source == "square" and self.sales_cursor is not None and pid > self.sales_cursor:
+                continue   # not fed in yet: real_sales() adds it this cycle
+            self.demand.add(drink, qty, datetime.fromisoformat(ts).timestamp())
+        self._demand_day = market_day
+
+    def demand_drift(self, keys, at, params):
+        """Per-drink demand drift at ``at``: the short windows' mean pace against the longest."""
+        return demand_drift(self.demand.rates(keys, at.timestamp()), params)
+
+    def on_close(self, now_utc):
+        """Archive/drop days past the retention window while nobody is watching."""
+        self._sales_floor = None   # the next session counts sales from its own first tick
+        if self._maintenance is None or not self._maintenance.is_alive():
+            self._maintenance = threading.Thread(
+                target=run_maintenance,
+                args=(self.location.market_day(now_utc), self.location.db_path),
+                daemon=True,
+            )
+            self._maintenance.start()
+
+    def simulate_purchase(self, prices: dict, purchase_rows: list) -> dict:
+        """Simulate a purchase using current prices.
+
+        The chance of purchasing a drink decreases linearly as its price
+        approaches $10 and increases as it nears $2.  At $10 no purchase
+        occurs and at $2 a purchase always occurs (see market.choose_purchases).
+        A paid purchase is appended to ``purchase_rows`` so it is stored with
+        the rest of the cycle.
+        Returns ``{drink_key: quantity}`` or ``{}`` if no purchase happens.
+        """
+        if not prices:
+            log.debug("No purchase this cycle")
+            return {}
+
+        drink_keys = list(prices.keys())
+        qtys = market.choose_purchases(np.array([prices[d] for d in drink_keys]), self.rng,
+                                       self.registry.market_params(drink_keys))
+        bought = np.flatnonzero(qtys)
+        if bought.size == 0:
+            log.debug("No purchase this cycle")
+            return {}
+
+        drink_key = drink_keys[bought[0]]
+        qty = int(qtys[bought[0]])
+        variation_id = self.drinks[drink_key]
+        log.info("[%s] Simulating %d purchase(s)…", drink_key, qty)
+
+        # Create Order
+        order_url = f"{SQUARE_API_URL}/orders"
+        order_body = {
+            "order": {
+                "location_id": self.location.square_location_id,
+                # Lets the webhook ingester skip the sales this engine records itself
+                "reference_id": ENGINE_ORDER_REFERENCE,
+                "line_items": [
+                    {
+                        "catalog_object_id": variation_id,
+                        "quantity": str(qty)
+                    }
+                ]
+            },
+            "idempotency_key": str(uuid.uuid4())
+        }
+        try:
+            order_resp = square.post("/orders", json=order_body)
+        except Exception as e:
+            log.error("[%s] Unable to create Square order: %s", drink_key, e)
+            return {}
+        log.info("POST %s → HTTP %s", order_url, order_resp.status_code)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("order response: %s", order_resp.text)
+
+        if order_resp.status_code not in (200, 201):
+            log.error("[%s] Unable to create Square order (HTTP %s)", drink_key, order_resp.status_code)
+            return {}
+
+        order_data = order_resp.json().get("order", {})
+        order_id   = order_data.get("id")
+        total_cents = order_data.get("total_money", {}).get("amount", 0)
+        if not order_id or total_cents is None:
+            log.error("[%s] Invalid order_id or total_money.", drink_key)
+            return {}
+
+        # Create Payment
+        payment_url = f"{SQUARE_API_URL}/payments"
+        payment_body = {
+            "source_id": "cnon:card-nonce-ok",
+            "idempotency_key": str(uuid.uuid4()),
+            "amount_money": {
+                "amount": total_cents,
+                "currency": "USD"
+            },
+            "order_id": order_id,
+            "location_id": self.location.square_location_id
+        }
+        try:
+            pay_resp = square.post("/payments", json=payment_body)
+        except Exception as e:
+            log.error("[%s] Unable to pay order: %s", drink_key, e)
+            return {drink_key: qty}
+        log.info("POST %s → HTTP %s", payment_url, pay_resp.status_code)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("payment response: %s", pay_resp.text)
+
+        if pay_resp.status_code not in (200, 201):
+            log.error("[%s] Unable to pay order.", drink_key)
+            return {drink_key: qty}
+
+        log.info("[%s] Order %s paid for $%.2f", drink_key, order_id, total_cents / 100)
+
+        # Record purchase locally so the dashboard can display history
+        now_ts = datetime.now(tz=pytz.utc).isoformat()
+        purchase_rows.append((now_ts, drink_key, qty, total_cents / 100.0))
+
+        return {drink_key: qty}
+
+    def apply_pricing_logic(self, current_prices: dict, purchases: dict, now_utc) -> dict:
+        """
+        Step every drink one tick with the shared vectorized market step, so the
+        live engine moves prices exactly like simulate.py does, plus the drift
+        from the demand windows at ``now_utc``.
+        Returns ``{drink_key: new_price}``.
+        """
+        keys = list(current_prices)
+        prices = np.array([current_prices[d] for d in keys])
+        qty = np.array([purchases.get(d, 0) for d in keys])
+        params = self.registry.market_params(keys)
+
+        new_prices = market.step(prices, qty, self.rng, params, self.demand_drift(keys, now_utc, params))
+        streaks = market.update_streaks([self.no_purchase_streak.get(d, 0) for d in keys], qty)
+        self.no_purchase_streak.update(zip(keys, streaks.tolist()))
+        return {d: float(p) for d, p in zip(keys, new_prices)}
+
+    def target_price(self, drink_key):
+        """Opening price for a drink Square and the price bus know nothing about."""
+        drink = self.registry.get(drink_key)
+        return drink.params.get("target_price", TARGET_PRICE) if drink else TARGET_PRICE
+
+
+def run_maintenance(today, db_path=None):
+    try:
+        storage.run_maintenance(today, path=db_path)
+    except Exception as e:
+        log.exception("Maintenance failed: %s", e)
 
 
 def run_engine():
-    print("Starting pricing engine (active 4 PM–12 AM Eastern)…")
-    last_reset_date = None
-
-    while True:
-        now_utc = datetime.now(tz=pytz.utc)
-        now_eastern = now_utc.astimezone(EASTERN)
-        hour = now_eastern.hour
-
-        if 16 <= hour < 24:
-            # Reset history and purchases once at the start of each market day
-            if last_reset_date != now_eastern.date():
-                try:
-                    conn = sqlite3.connect(DB_PATH)
-                    c    = conn.cursor()
-                    c.execute("DELETE FROM history")
-                    c.execute("DELETE FROM purchases")
-                    conn.commit()
-                    conn.close()
-                    last_reset_date = now_eastern.date()
-                    print("[Reset] Cleared previous price and purchase history")
-                except Exception as e:
-                    print(f"[Reset] Failed to clear history/purchases: {e}")
-
-            # 1) Fetch current prices for all drinks
-            current_prices = {}
-            for drink, variation_id in DRINKS.items():
-                try:
-                    current_prices[drink] = get_square_price(variation_id, drink)
-                except Exception as e:
-                    print(f"[{drink}] Error retrieving price: {e}")
-                    current_prices[drink] = TARGET_PRICE
-
-            # 2) Simulate purchases using those prices
-            purchases = simulate_real_square_purchase(current_prices)
-
-            # 3) For each drink compute new price and update Square
-            for drink, variation_id in DRINKS.items():
-                current_price = current_prices.get(drink, TARGET_PRICE)
-                new_price = apply_pricing_logic(drink, current_price, purchases)
-                update_square_price(drink, variation_id, new_price)
-
-                # 4) Insert into SQLite history
-                conn = sqlite3.connect(DB_PATH)
-                c    = conn.cursor()
-                now_ts = datetime.now(tz=pytz.utc).isoformat()
-                c.execute(
-                    "INSERT INTO history (timestamp, drink, price) VALUES (?, ?, ?)",
-                    (now_ts, drink, new_price)
-                )
-                conn.commit()
-                conn.close()
-
-            time.sleep(60)
-        else:
-            secs = seconds_until_next_4pm_eastern()
-            hrs  = int(secs // 3600)
-            mins = int((secs % 3600) // 60)
-            secs_rem = int(secs % 60)
-            print(f"[{now_eastern.strftime('%Y-%m-%d %H:%M:%S')} ET] "
-                  f"Outside active hours. Sleeping {hrs}h{mins}m{secs_rem}s.")
-            time.sleep(secs)
+    setup_logging()
+    if not ACCESS_TOKEN:
+        log.error("SQUARE_ACCESS_TOKEN is empty! Exiting.")
+        sys.exit(1)
+    try:
+        locations = scheduler.load_locations()
+    except (OSError, ValueError) as e:
+        log.error("Invalid location config (set SQUARE_LOCATION_ID or locations.json): %s", e)
+        sys.exit(1)
+
+    # ENGINE_SEED makes every location reproducible, each with its own stream
+    base_seed = os.getenv("ENGINE_SEED", "").strip()
+    engines = []
+    for i, loc in enumerate(locations):
+        seed = loc.seed if loc.seed is not None else ([int(base_seed), i] if base_seed else None)
+        engines.append(LocationEngine(loc, seed=seed))
+        log.info("Starting pricing engine for %s (active %d:00–%d:00 %s, every %gs)…",
+                 loc.name, loc.open_hour, loc.close_hour % 24, loc.timezone, loc.tick_seconds)
+    if metrics.serve():
+        log.info("Serving engine metrics on :%s/metrics", os.getenv("ENGINE_METRICS_PORT"))
+    scheduler.Scheduler(engines).run()
 
 
 if __name__ == "__main__":
     run_engine()
-
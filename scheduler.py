@@ -0,0 +1,236 @@
+"""
+Engine scheduler: drives every configured location's market concurrently.
+
+Locations come from LOCATIONS_CONFIG (JSON)::
+
+    {"locations": [{"name": "downtown", "square_location_id": "L123…",
+                    "timezone": "US/Eastern", "open_hour": 16, "close_hour": 24,
+                    "tick_seconds": 60, "drinks_config": "drinks.json",
+                    "db_path": "price_history.db"},
+                   …]}
+
+Without that file a single location is built from SQUARE_LOCATION_ID and
+the defaults below, which is exactly the old one-venue engine.  Every
+location needs its own ``db_path`` (at most one may use the default DB_PATH).
+
+  • Each location runs on its own thread, so a slow Square call at one
+    venue never delays another venue's tick.
+  • Ticks are deadline based: the next tick is due ``tick_seconds`` after the
+    previous *deadline*, not after the previous cycle finished, so cycle time
+    never accumulates as drift.  A cycle that overruns whole ticks skips
+    them (counted as ``missed_ticks``) instead of firing a burst.
+  • Every state change is written to ``engine_status`` in the main database
+    for the web tier (``/engine/status``); cycle timings also go to metrics.py.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import pytz
+
+import storage
+from drinks import DRINKS_CONFIG
+from metrics import Counter, Histogram
+
+log = logging.getLogger("scheduler")
+
+LOCATIONS_CONFIG = os.getenv(
+    "LOCATIONS_CONFIG", os.path.join(os.path.dirname(__file__), "locations.json")
+)
+
+DEFAULT_TIMEZONE     = "US/Eastern"
+DEFAULT_OPEN_HOUR    = 16    # 4 PM local
+DEFAULT_CLOSE_HOUR   = 24    # midnight local
+DEFAULT_TICK_SECONDS = 60
+
+CYCLE_SECONDS = Histogram("engine_cycle_seconds", "Wall time of one pricing cycle.", ("location",))
+CYCLE_ERRORS  = Counter("engine_cycle_errors_total", "Pricing cycles that raised.", ("location",))
+MISSED_TICKS  = Counter("engine_missed_ticks_total", "Ticks skipped because a cycle overran.", ("location",))
+
+
+@dataclass
+class Location:
+    name: str
+    square_location_id: str
+    timezone: str = DEFAULT_TIMEZONE
+    open_hour: int = DEFAULT_OPEN_HOUR
+    close_hour: int = DEFAULT_CLOSE_HOUR   # may be ≤ open_hour for sessions past midnight
+    tick_seconds: float = DEFAULT_TICK_SECONDS
+    drinks_config: str = DRINKS_CONFIG
+    db_path: str = None                    # None → storage.DB_PATH
+    seed: int = None
+
+    def __post_init__(self):
+        self.tz = pytz.timezone(self.timezone)
+        if self.open_hour % 24 == self.close_hour % 24:
+            raise ValueError(f"{self.name}: open_hour and close_hour must differ")
+
+    def local(self, now_utc):
+        return now_utc.astimezone(self.tz)
+
+    def is_open(self, now_utc):
+        hour = self.local(now_utc).hour
+        if self.open_hour < self.close_hour:
+            return self.open_hour <= hour < self.close_hour
+        return hour >= self.open_hour or hour < self.close_hour
+
+    def market_day(self, now_utc):
+        """The local date the current session opened on."""
+        local = self.local(now_utc)
+        if self.open_hour >= self.close_hour and local.hour < self.close_hour:
+            local -= timedelta(days=1)
+        return storage.market_day_for(local)
+
+    def seconds_until_open(self, now_utc):
+        local = self.local(now_utc)
+        start = self.tz.localize(datetime(local.year, local.month, local.day, self.open_hour))
+        if start <= local:
+            tomorrow = local.date() + timedelta(days=1)
+            start = self.tz.localize(datetime(tomorrow.year, tomorrow.month, tomorrow.day, self.open_hour))
+        return max((start - local).total_seconds(), 0)
+
+
+def load_locations(path=LOCATIONS_CONFIG):
+    """Read the locations file, or fall back to the single SQUARE_LOCATION_ID venue."""
+    if not os.path.exists(path):
+        location_id = os.getenv("SQUARE_LOCATION_ID")
+        if not location_id:
+            raise ValueError(f"no {os.path.basename(path)} and SQUARE_LOCATION_ID is empty")
+        return [Location(name=os.getenv("LOCATION_NAME", "default"), square_location_id=location_id)]
+
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} must hold an object with a \"locations\" list")
+    locations = []
+    for i, entry in enumerate(config.get("locations", [])):
+        # Unknown keys and bad time zones surface as ValueError like the rest
+        try:
+            locations.append(Location(**entry))
+        except (TypeError, pytz.UnknownTimeZoneError) as e:
+            name = entry.get("name", f"#{i + 1}") if isinstance(entry, dict) else f"#{i + 1}"
+            raise ValueError(f"location {name}: {type(e).__name__}: {e}") from e
+    if not locations:
+        raise ValueError(f"{path} lists no locations")
+
+    names, db_paths = set(), set()
+    for loc in locations:
+        if loc.name in names:
+            raise ValueError(f"duplicate location name {loc.name!r}")
+        names.add(loc.name)
+        # history, latest_prices, candles and purchases are keyed by drink
+        # only, so two venues in one file would mix (and overwrite) each other
+        db_path = os.path.abspath(loc.db_path or storage.DB_PATH)
+        if db_path in db_paths:
+            raise ValueError(f"{loc.name}: another location already uses {db_path}; give each its own db_path")
+        db_paths.add(db_path)
+    return locations
+
+
+class Scheduler:
+    """
+    Runs ``engine.run_cycle(now_utc)`` for each engine on its own thread.
+    An engine needs a ``location`` (Location), ``run_cycle(now_utc)`` and
+    ``on_close(now_utc)`` (called once each time its session ends).
+    """
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for engine in self.engines:
+            thread = threading.Thread(
+                target=self._drive, args=(engine,), name=f"market-{engine.location.name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Start every location and block until stopped (Ctrl-C stops cleanly)."""
+        self.start()
+        try:
+            while any(t.is_alive() for t in self._threads):
+                for thread in self._threads:
+                    thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            self.stop()
+
+    # ─── PER-LOCATION LOOP ─────────────────────────────────────────────────────
+    def _drive(self, engine):
+        loc = engine.location
+        ticks = missed = 0
+        was_open = None   # unknown at startup: a closed start still gets on_close()
+        _status(loc, "starting")
+
+        while not self._stop.is_set():
+            now_utc = datetime.now(tz=pytz.utc)
+            if not loc.is_open(now_utc):
+                if was_open is not False:
+                    engine.on_close(now_utc)
+                was_open = False
+                wait = loc.seconds_until_open(now_utc)
+                _status(loc, "closed", next_tick_at=(now_utc + timedelta(seconds=wait)).isoformat())
+                log.info("[%s] Outside trading hours (%s %s). Sleeping %s.",
+                         loc.name, f"{loc.local(now_utc):%Y-%m-%d %H:%M}", loc.timezone, _hms(wait))
+                self._stop.wait(wait)
+                continue
+
+            if not was_open:
+                was_open = True
+                deadline = time.monotonic()
+
+            started = time.monotonic()
+            error = None
+            try:
+                engine.run_cycle(now_utc)
+                ticks += 1
+            except Exception as e:   # one bad cycle must not stop the location
+                error = f"{type(e).__name__}: {e}"
+                CYCLE_ERRORS.inc(location=loc.name)
+                log.exception("[%s] Cycle failed: %s", loc.name, error)
+            cycle_seconds = time.monotonic() - started
+            CYCLE_SECONDS.observe(cycle_seconds, location=loc.name)
+
+            # Next deadline is relative to the last one, never to "now".  An
+            # overdue tick runs straight away; only whole ticks already past
+            # are skipped.
+            deadline += loc.tick_seconds
+            late = time.monotonic() - deadline
+            skipped = int(late // loc.tick_seconds) if late >= 0 else 0
+            if skipped:
+                missed += skipped
+                deadline += skipped * loc.tick_seconds
+                MISSED_TICKS.inc(skipped, location=loc.name)
+                log.warning("[%s] Cycle overran by %.2fs; skipping %d tick(s)", loc.name, late, skipped)
+
+            wait = max(deadline - time.monotonic(), 0)
+            _status(
+                loc, "error" if error else "open",
+                market_day=loc.market_day(now_utc), ticks=ticks, missed_ticks=missed,
+                last_tick_at=now_utc.isoformat(), last_cycle_ms=round(cycle_seconds * 1000, 1),
+                next_tick_at=(datetime.now(tz=pytz.utc) + timedelta(seconds=wait)).isoformat(),
+                last_error=error,
+            )
+            self._stop.wait(wait)
+
+
+def _status(loc, state, **fields):
+    try:
+        storage.set_engine_status(loc.name, state, timezone=loc.timezone, **fields)
+    except Exception as e:
+        log.warning("[%s] Could not record engine status: %s", loc.name, e)
+
+
+def _hms(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60}m{seconds % 60}s"
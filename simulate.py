@@ -0,0 +1,161 @@
+"""
+Offline Monte-Carlo market simulator.
+
+Runs thousands of market nights through the same vectorized step the live
+engine uses (market.py), including the drift from decayed 5/15/60 minute
+demand counters (demand.py, one set per night), with no Square or database
+access, and reports the price distribution, floor hits and revenue.  Handy
+for tuning ALPHA_AT_*, RANDOM_RANGE or the demand weight without waiting a
+whole night:
+
+    python simulate.py --nights 10000 --seed 1
+    python simulate.py --alpha-low 0.2 --random-range 0.05 --json
+    python simulate.py --demand-weight 0.02 --demand-floor-rate 0.2
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import market
+from demand import DEMAND_WINDOWS, demand_drift
+
+DRINK_COUNT = 10          # drinks on the board
+HOURS       = 8           # 4 PM – midnight
+TICK_SECONDS = 60
+PRICE_BINS  = 100_000     # histogram of prices in whole cents up to $1000
+
+
+def simulate(nights, params, drinks=DRINK_COUNT, hours=HOURS, tick_seconds=TICK_SECONDS,
+             start_price=market.TARGET_PRICE, seed=None):
+    """Simulate ``nights`` independent nights at once and return summary stats."""
+    rng = market.make_rng(seed)
+    ticks = int(hours * 3600 // tick_seconds)
+
+    prices = np.full((nights, drinks), float(start_price))
+    price_counts = np.zeros(PRICE_BINS, dtype=np.int64)
+    floor_hits = np.zeros(nights, dtype=np.int64)
+    units = np.zeros(nights, dtype=np.int64)
+    revenue = np.zeros(nights)
+
+    # Decayed units sold per night, drink and window, as DemandTracker keeps
+    # them: every tick decays by exp(-tick / window) and adds that tick's sales
+    windows = np.asarray(DEMAND_WINDOWS, dtype=float)
+    decay = np.exp(-tick_seconds / windows)
+    counts = np.zeros((nights, drinks, len(windows)))
+
+    for _ in range(ticks):
+        qty = market.choose_purchases(prices, rng, params)
+        units += qty.sum(axis=1)
+        revenue += (qty * prices).sum(axis=1)
+
+        counts = counts * decay + qty[..., None]
+        demand = demand_drift(counts / windows * 60, params)
+        prices = market.step(prices, qty, rng, params, demand)
+        floor_hits += (prices <= params.floor_price).sum(axis=1)
+        cents = np.clip(np.rint(prices * 100).astype(np.int64), 0, PRICE_BINS - 1)
+        price_counts += np.bincount(cents.ravel(), minlength=PRICE_BINS)
+
+    return {
+        "nights": nights,
+        "ticks_per_night": ticks,
+        "drinks": drinks,
+        "price": _histogram_summary(price_counts),
+        "closing_price": _summary(prices.ravel()),
+        "floor_hits_per_night": _summary(floor_hits),
+        "nights_touching_floor": round(float((floor_hits > 0).mean()), 4),
+        "units_per_night": _summary(units),
+        "revenue_per_night": _summary(revenue),
+    }
+
+
+def _summary(values):
+    pct = np.percentile(values, [5, 50, 95])
+    return {
+        "mean": round(float(np.mean(values)), 2),
+        "p5": round(float(pct[0]), 2),
+        "p50": round(float(pct[1]), 2),
+        "p95": round(float(pct[2]), 2),
+        "min": round(float(np.min(values)), 2),
+        "max": round(float(np.max(values)), 2),
+    }
+
+
+def _histogram_summary(counts):
+    """Same keys as _summary(), computed from a histogram of prices in cents."""
+    total = counts.sum()
+    cents = np.arange(len(counts))
+    cum = np.cumsum(counts)
+    nonzero = np.flatnonzero(counts)
+
+    def pct(q):
+        return round(float(np.searchsorted(cum, q / 100.0 * total)) / 100, 2)
+
+    return {
+        "mean": round(float((counts * cents).sum() / total) / 100, 2),
+        "p5": pct(5),
+        "p50": pct(50),
+        "p95": pct(95),
+        "min": round(nonzero[0] / 100, 2),
+        "max": round(nonzero[-1] / 100, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nights", type=int, default=1000)
+    parser.add_argument("--drinks", type=int, default=DRINK_COUNT)
+    parser.add_argument("--hours", type=float, default=HOURS)
+    parser.add_argument("--tick", type=int, default=TICK_SECONDS, help="seconds per tick")
+    parser.add_argument("--start-price", type=float, default=market.TARGET_PRICE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--floor", type=float, default=market.FLOOR_PRICE)
+    parser.add_argument("--random-range", type=float, default=market.RANDOM_RANGE)
+    parser.add_argument("--target", type=float, default=market.TARGET_PRICE)
+    parser.add_argument("--alpha-low", type=float, default=market.ALPHA_AT_LOW)
+    parser.add_argument("--alpha-mid", type=float, default=market.ALPHA_AT_MID)
+    parser.add_argument("--alpha-high", type=float, default=market.ALPHA_AT_HIGH)
+    parser.add_argument("--demand-weight", type=float, default=market.DEMAND_WEIGHT,
+                        help="largest demand drift per tick")
+    parser.add_argument("--demand-floor-rate", type=float, default=market.DEMAND_FLOOR_RATE,
+                        help="units/minute below which the long-run pace counts as this")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON report")
+    args = parser.parse_args(argv)
+
+    params = market.MarketParams(
+        floor_price=args.floor,
+        random_range=args.random_range,
+        target_price=args.target,
+        alpha_at_low=args.alpha_low,
+        alpha_at_mid=args.alpha_mid,
+        alpha_at_high=args.alpha_high,
+        demand_weight=args.demand_weight,
+        demand_floor_rate=args.demand_floor_rate,
+    )
+
+    started = time.perf_counter()
+    report = simulate(args.nights, params, drinks=args.drinks, hours=args.hours,
+                      tick_seconds=args.tick, start_price=args.start_price, seed=args.seed)
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Simulated {report['nights']} nights × {report['ticks_per_night']} ticks × "
+          f"{report['drinks']} drinks in {report['elapsed_seconds']}s")
+    for label, key in (("Price (all ticks)", "price"),
+                       ("Closing price", "closing_price"),
+                       ("Floor hits / night", "floor_hits_per_night"),
+                       ("Units / night", "units_per_night"),
+                       ("Revenue / night", "revenue_per_night")):
+        s = report[key]
+        print(f"  {label:<20} mean {s['mean']:>9}  p5 {s['p5']:>9}  p50 {s['p50']:>9}  "
+              f"p95 {s['p95']:>9}  min {s['min']:>9}  max {s['max']:>9}")
+    print(f"  Nights touching floor: {report['nights_touching_floor'] * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
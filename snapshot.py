@@ -0,0 +1,116 @@
+"""
+Everything a dashboard needs to cold-start, in one pre-compressed document.
+
+The snapshot is rebuilt at most once per engine tick per worker: each request
+first checks the newest history/purchase ids (two primary-key lookups) and,
+if nothing changed, gets the bytes already in memory.  Bodies are kept
+identity, gzip and (when the optional ``brotli`` package is installed)
+brotli encoded.  Prices come from the caller (the engine's
+``latest_prices`` bus, Square as fallback); directions compare each drink's
+price with the one published a cycle earlier.
+
+Document shape::
+
+    {"market_day": "2025-06-12", "generated_at": "...",
+     "prices":     {"Bud Light": 4.15, …},
+     "directions": {"Bud Light": "up"|"down"|"flat", …},
+     "history":    {"Bud Light": [[bucket, close], …], …},   # 1m candles
+     "purchases":  [{id, timestamp, drink, quantity, price}, …]}
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+import storage
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+
+class SnapshotBuilder:
+    def __init__(self, key_to_display, current_prices, history_points=300, purchases=10):
+        self.key_to_display = key_to_display
+        self.current_prices = current_prices
+        self.history_points = history_points
+        self.purchases = purchases
+
+        self._version = None
+        self._current = (None, {})   # (etag, {encoding: body}), swapped atomically
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.last_build_ms = None
+
+    def get(self):
+        """Return ``(etag, {encoding: body})`` for the current tick."""
+        conn = storage.reader()
+        version = self._probe(conn)
+        if version == self._version:
+            return self._current
+        with self._lock:
+            # Another thread may have rebuilt it while we waited
+            if version != self._version:
+                self._build(conn, version)
+        return self._current
+
+    @staticmethod
+    def _probe(conn):
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM history")
+        history_id = c.fetchone()[0]
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM purchases")
+        return history_id, c.fetchone()[0]
+
+    def _build(self, conn, version):
+        started = time.perf_counter()
+        c = conn.cursor()
+        day = storage.current_market_day(c)
+
+        prices = self.current_prices()
+        latest = storage.latest_prices(conn)
+        directions, history = {}, {}
+        for key, name in self.key_to_display.items():
+            price, previous, _updated = latest.get(key, (None, None, None))
+            if price is None or previous is None or price == previous:
+                directions[name] = "flat"
+            else:
+                directions[name] = "up" if price > previous else "down"
+
+            c.execute(
+                "SELECT bucket, close FROM candles WHERE market_day = ? AND drink = ? "
+                "AND interval = ? AND close IS NOT NULL ORDER BY bucket DESC LIMIT ?",
+                (day, key, storage.CANDLE_INTERVALS["1m"], self.history_points)
+            )
+            history[name] = [[t, close] for t, close in reversed(c.fetchall())]
+
+        c.execute(
+            "SELECT id, timestamp, drink, quantity, price FROM purchases "
+            "WHERE market_day = ? ORDER BY id DESC LIMIT ?",
+            (day, self.purchases)
+        )
+        purchases = storage.purchase_dicts(c.fetchall(), self.key_to_display)
+
+        doc = {
+            "market_day": day,
+            "generated_at": datetime.now(tz=pytz.utc).isoformat(),
+            "prices": prices,
+            "directions": directions,
+            "history": history,
+            "purchases": purchases,
+        }
+        raw = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+        bodies = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=6)}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(raw, quality=5)
+
+        self._current = (hashlib.md5(f"{version}|{day}".encode()).hexdigest(), bodies)
+        self._version = version
+        self.builds += 1
+        self.last_build_ms = round((time.perf_counter() - started) * 1000, 2)
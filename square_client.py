@@ -0,0 +1,182 @@
+"""
+Pooled HTTP client for the Square API, shared by app.py and pricing_engine.py.
+
+  • One ``requests.Session`` per client → keep-alive connections are reused.
+  • Every call gets a (connect, read) timeout unless the caller overrides it.
+  • Connection errors, 429s and 5xx responses are retried a bounded number of
+    times with exponential backoff.  POSTs are retried too: every mutating
+    Square call we make carries an ``idempotency_key``.
+  • Every call's latency and final status are recorded in metrics.py.
+  • ``iter_catalog()`` follows ``catalog/list`` cursors one page at a time,
+    so callers can stop as soon as they have what they need.
+
+Calls return the plain ``requests.Response`` so callers keep checking
+``status_code`` and ``json()`` exactly as before; network failures raise
+``requests.RequestException``.
+
+``AsyncSquareClient`` is the same client for the ASGI entry point (asgi.py):
+an ``httpx.AsyncClient`` with one connection pool per event loop, the same
+headers, timeouts, retry policy and metrics.  Its calls return
+``httpx.Response`` (same ``status_code`` / ``json()``) and network failures
+raise ``httpx.HTTPError``.  httpx is optional and only needed for that mode.
+"""
+
+import asyncio
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import SQUARE_RESPONSES, SQUARE_SECONDS
+
+try:
+    import httpx
+except ImportError:   # only the ASGI entry point needs it
+    httpx = None
+
+SQUARE_API_URL = os.getenv("SQUARE_API_URL", "https://connect.squareupsandbox.com/v2")
+SQUARE_VERSION = "2025-05-21"
+
+DEFAULT_TIMEOUT = (3.05, 5)   # (connect, read) seconds
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.3         # sleeps 0.3s, 0.6s, … between retries
+POOL_SIZE       = 16
+RETRY_STATUSES  = (429, 500, 502, 503, 504)
+
+# reference_id on the orders the pricing engine creates (see webhooks.py)
+ENGINE_ORDER_REFERENCE = "pricing-engine"
+
+
+class SquareClient:
+    def __init__(self, access_token, base_url=SQUARE_API_URL, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=POOL_SIZE):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,      # all methods; see module docstring
+            respect_retry_after_header=True,
+            raise_on_status=False,     # hand the last response back to the caller
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {access_token}",
+            "Square-Version": SQUARE_VERSION,
+            "Content-Type": "application/json",
+        })
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = "/" + path.lstrip("/")
+        started = time.perf_counter()
+        status = "error"
+        try:
+            resp = self.session.request(method, self.url(path), **kwargs)
+            status = resp.status_code
+            return resp
+        finally:
+            SQUARE_SECONDS.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
+            SQUARE_RESPONSES.inc(method=method, endpoint=endpoint, status=status)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def iter_catalog(self, types="ITEM_VARIATION"):
+        """
+        Yield catalog objects of ``types`` page by page, following cursors.
+        Only one page is held in memory; stop iterating to skip the rest.
+        Raises ``requests.HTTPError`` if a page cannot be read.
+        """
+        params = {"types": types}
+        while True:
+            resp = self.get("/catalog/list", params=params)
+            resp.raise_for_status()
+            page = resp.json()
+            yield from page.get("objects", [])
+            cursor = page.get("cursor")
+            if not cursor:
+                return
+            params = {**params, "cursor": cursor}
+
+
+class AsyncSquareClient:
+    def __init__(self, access_token, base_url=SQUARE_API_URL, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=POOL_SIZE):
+        if httpx is None:
+            raise RuntimeError("AsyncSquareClient needs the httpx package (pip install httpx)")
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        connect, read = timeout
+        # Created on first use, inside the event loop that will use it
+        self._client = None
+        self._client_kwargs = dict(
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Square-Version": SQUARE_VERSION,
+                "Content-Type": "application/json",
+            },
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(**self._client_kwargs)
+        return self._client
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method, path, **kwargs):
+        """One Square call, retried like ``SquareClient.request``."""
+        endpoint = "/" + path.lstrip("/")
+        started = time.perf_counter()
+        status = "error"
+        try:
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    resp = await self.client.request(method, self.url(path), **kwargs)
+                except httpx.TransportError:
+                    if last:
+                        raise
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    continue
+                status = resp.status_code
+                if resp.status_code not in RETRY_STATUSES or last:
+                    return resp
+                retry_after = resp.headers.get("Retry-After", "")
+                await asyncio.sleep(float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt)
+        finally:
+            SQUARE_SECONDS.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
+            SQUARE_RESPONSES.inc(method=method, endpoint=endpoint, status=status)
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,11 +1,30 @@
 #!/usr/bin/env bash
 # ─── start-both.sh ─────────────────────────────────────────────────────
+set -e
 
-# 1) Launch the pricing engine in the background (log output to pricing_engine.log)
-python pricing_engine.py &> pricing_engine.log &
+# 1) Bring the SQLite schema up to date once, before either process starts.
+#    Idempotent, and it returns only when the database is ready, so neither
+#    the engine nor the web workers can race each other on DDL.
+python storage.py migrate
 
-# 2) Wait 5 seconds so SQLite has time to create price_history.db and the history table
-sleep 5
+# 2) Launch the pricing engine in the background (log output to pricing_engine.log)
+python pricing_engine.py &> pricing_engine.log &
 
 # 3) Replace this shell with Gunicorn bound to $PORT
-exec gunicorn wsgi:server --bind 0.0.0.0:"${PORT}"
+#    --preload: the app is imported once in the master and forked (no DB
+#    connections are opened at import, so nothing unsafe is shared).
+#    WEB_MODE=asgi: a few event-loop workers (asgi.py); /stream and Square
+#    calls are coroutines, so they hold neither a worker nor a thread.
+if [ "${WEB_MODE:-wsgi}" = "asgi" ]; then
+  exec gunicorn asgi:app --bind 0.0.0.0:"${PORT}" --preload \
+    --worker-class uvicorn.workers.UvicornWorker --workers "${WEB_CONCURRENCY:-2}"
+fi
+#    Threaded workers: each open /stream (SSE) connection holds one thread,
+#    so streams are capped below the thread count; dashboards past the cap get
+#    503 and poll, leaving threads for /snapshot, /candles and Square's
+#    webhooks.  For hundreds of screens use WEB_MODE=asgi, or raise
+#    WEB_CONCURRENCY × GUNICORN_THREADS to the expected screen count.
+THREADS="${GUNICORN_THREADS:-64}"
+export STREAM_MAX_SUBSCRIBERS="${STREAM_MAX_SUBSCRIBERS:-$(( THREADS > 32 ? THREADS - 16 : THREADS / 2 ))}"
+exec gunicorn wsgi:server --bind 0.0.0.0:"${PORT}" --preload \
+  --worker-class gthread --workers "${WEB_CONCURRENCY:-1}" --threads "${THREADS}"
@@ -2,12 +2,20 @@
 
 // ─── CONFIG/STATE ──────────────────────────────────────────────────────────────
 const MAX_HISTORY = 300;           // max points to keep in the chart per drink
+const CANDLE_INTERVAL = "1m";      // candle size the chart is drawn from (/candles)
 let currentIndex = 0;              // which drink to show in the chart each cycle
 let drinks = [];                   // list of drink names (keys)
 let previousPrices = {};           // { "Bud Light": 4.12, … } from last fetch
 let priceDirections = {};          // { "Bud Light": "up"|"down"|"flat" }
 let chartInitialized = false;      // true once Plotly.newPlot has been called
 let activeDrink = null;            // which drink is currently displayed
+let purchaseLog = [];              // last 10 purchases, newest first
+let lastPurchaseId = 0;            // highest purchase id seen (cursor for /purchases)
+let historyCache = {};             // { "Bud Light": [ { timestamp, price }, … ] } last MAX_HISTORY points
+let candleCursor = {};             // { "Bud Light": newest candle bucket fetched }
+let latestPrices = {};             // newest known prices (from /prices or /stream)
+let streamLive = false;            // true while the /stream (SSE) connection is open
+let snapshotOk = false;            // true when the last /snapshot refresh succeeded
 
 // ─── MARKET HOURS ──────────────────────────────────────────────────────────────
 // New hours: open at 16:00 ET (4 PM) and close at 00:00 ET (midnight).
@@ -57,24 +65,68 @@ async function fetchPrices() {
 }
 
 // ─── FETCH SERVER HISTORY FOR A DRINK ─────────────────────────────────────────
+// The chart is drawn from pre-aggregated candles (one close per bucket), so
+// the payload stays bounded however long the market has been open. After the
+// first load only candles from the newest fetched bucket onward are asked
+// for; that bucket may still have been growing, so it is replaced.
 async function fetchHistory(drink) {
   const encodedName = encodeURIComponent(drink);
+  const cached = historyCache[drink] || [];
+  // The stream (every tick) or the last snapshot already keeps the cache current
+  if ((streamLive || snapshotOk) && cached.length > 0) return cached;
+  const cursor = candleCursor[drink];
+  const query = cursor
+    ? `interval=${CANDLE_INTERVAL}&since=${encodeURIComponent(cursor)}`
+    : `interval=${CANDLE_INTERVAL}&limit=${MAX_HISTORY}`;
   try {
-    const res = await fetch(`/history/${encodedName}`);
+    const res = await fetch(`/candles/${encodedName}?${query}`);
     if (!res.ok) throw new Error(`HTTP ${res.status}`);
-    return await res.json(); // [ { timestamp, price }, … ]
+    const candles = await res.json(); // [ { t, o, h, l, c, v }, … ]
+    if (candles.length === 0) return cached;
+    const fresh = candles.map(k => ({ timestamp: k.t, price: k.c }));
+    const kept = cursor ? cached.filter(pt => pt.timestamp < cursor) : [];
+    historyCache[drink] = [ ...kept, ...fresh ].slice(-MAX_HISTORY);
+    candleCursor[drink] = candles[candles.length - 1].t;
+    return historyCache[drink];
   } catch (err) {
-    console.error(`Failed to fetch /history/${drink}:`, err);
-    return [];
+    console.error(`Failed to fetch /candles/${drink}:`, err);
+    return cached;
+  }
+}
+
+// ─── FETCH THE SNAPSHOT (prices, arrows, history, purchases in one request) ───
+// Returns true when the snapshot was applied.
+async function loadSnapshot() {
+  try {
+    const res = await fetch("/snapshot");
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const snap = await res.json();
+    latestPrices = { ...snap.prices };
+
+    // Seed arrows after a reboot so the board doesn't start all-flat
+    if (Object.keys(previousPrices).length === 0) priceDirections = { ...snap.directions };
+
+    // History is only charted while the market is open
+    if (isMarketOpenET()) {
+      Object.entries(snap.history).forEach(([name, points]) => {
+        historyCache[name] = points.map(([t, price]) => ({ timestamp: t, price })).slice(-MAX_HISTORY);
+        if (points.length > 0) candleCursor[name] = points[points.length - 1][0];
+      });
+    }
+    renderPurchases(snap.purchases.filter(p => p.id > lastPurchaseId));
+    return true;
+  } catch (err) {
+    console.error("Failed to fetch /snapshot:", err);
+    return false;
   }
 }
 
-// ─── FETCH PURCHASE HISTORY (last 10, newest first) ─────────────────────────
+// ─── FETCH NEW PURCHASES (newest first, only ids after our cursor) ───────────
 async function fetchPurchases() {
   try {
-    const res = await fetch("/purchases");
+    const res = await fetch(`/purchases?after=${lastPurchaseId}`);
     if (!res.ok) throw new Error(`HTTP ${res.status}`);
-    return await res.json(); // [ { drink, quantity, price }, … ]
+    return await res.json(); // [ { id, timestamp, drink, quantity, price }, … ]
   } catch (err) {
     console.error("Failed to fetch /purchases:", err);
     return [];
@@ -83,7 +135,7 @@ async function fetchPurchases() {
 
 // ─── INITIALIZE (OR RE‐INITIALIZE) PLOTLY CHART ─────────────────────────────────
 async function initChart(drink, livePrice) {
-  // 1) Fetch full history for that drink
+  // 1) Fetch history for that drink (incrementally after the first time)
   const histArray = await fetchHistory(drink);
 
   // 2) Build arrays of Date objects (x) and price (y)
@@ -258,12 +310,23 @@ function updateGrid(prices) {
 
 // ─── UPDATE PURCHASE HISTORY PANEL ────────────────────────────────────────────
 async function renderPurchaseHistory() {
-  const purchases = await fetchPurchases(); // newest first
+  renderPurchases(await fetchPurchases()); // newest first
+}
+
+// Merge newly seen purchases (newest first) into the panel
+function renderPurchases(fresh) {
   const container = document.getElementById("purchase-history");
+
+  // Nothing new since the last poll → leave the panel as it is
+  if (fresh.length === 0 && container.childElementCount > 0) return;
+  if (fresh.length > 0) {
+    lastPurchaseId = Math.max(lastPurchaseId, fresh[0].id || 0);
+    purchaseLog = [ ...fresh, ...purchaseLog ].slice(0, 10);
+  }
   container.innerHTML = "";
 
   // Always show the 10 most recent purchases regardless of active drink
-  const list = purchases.slice(0, 10);
+  const list = purchaseLog;
   if (list.length === 0) {
     // If there are no purchases at all, show a placeholder
     container.innerHTML = `<div class="no-purchase-msg">No purchases yet</div>`;
@@ -284,8 +347,14 @@ async function renderPurchaseHistory() {
 
 // ─── MAIN UPDATE LOOP ──────────────────────────────────────────────────────────
 async function updateDashboard() {
-  // 1) Always fetch the latest prices & build the `drinks` array
-  const prices = await fetchPrices();
+  // 1) Get the latest prices & build the `drinks` array. Unless /stream is
+  //    pushing updates, one /snapshot request refreshes everything (falling
+  //    back to /prices if the snapshot is unavailable).
+  if (!streamLive) {
+    snapshotOk = await loadSnapshot();
+    if (!snapshotOk) latestPrices = await fetchPrices();
+  }
+  const prices = { ...latestPrices };
   drinks = Object.keys(prices);
   if (drinks.length === 0) return; // no data → abort
 
@@ -308,11 +377,14 @@ async function updateDashboard() {
       chartInitialized = false;
       activeDrink = null;
     }
+    historyCache = {};
+    candleCursor = {};
     // Still update ticker & grid so they “freeze” on last known prices
     updateTicker(prices);
     updateGrid(prices);
     // Update purchase history (will show "No purchases yet" if none exist)
-    await renderPurchaseHistory();
+    if (!streamLive && !snapshotOk) await renderPurchaseHistory();
+    else renderPurchases([]);
     return;
   }
 
@@ -326,28 +398,70 @@ async function updateDashboard() {
     activeDrink = drink;
     chartInitialized = false;
     await initChart(drink, livePrice);
-  } else {
+  } else if (!streamLive) {
     // Same drink as last cycle, so append a new point
     appendToChart(drink, livePrice);
   }
 
-  // 5) Update ticker (top) and price grid (bottom)
-  updateTicker(prices);
-  updateGrid(prices);
-
-  // 6) Update purchase history panel
-  await renderPurchaseHistory();
-
-  // 7) Save currentPrices for next-cycle arrow & flash comparisons
-  previousPrices = { ...prices };
+  // 5–7) Without the stream, refresh ticker, grid and purchases from what
+  //      was just polled (with the stream, applyTick does this per tick)
+  if (!streamLive) {
+    updateTicker(prices);
+    updateGrid(prices);
+    if (!snapshotOk) await renderPurchaseHistory();
+    previousPrices = { ...prices };
+  }
 
   // 8) Advance index (wrap around) to rotate to the next drink next cycle
   currentIndex = (currentIndex + 1) % drinks.length;
 }
 
+// ─── PUSHED ENGINE TICKS (/stream) ─────────────────────────────────────────────
+// Each tick carries only what the engine just wrote: { timestamp, prices, purchases }
+function applyTick(tick) {
+  const changed = tick.prices || {};
+  latestPrices = { ...latestPrices, ...changed };
+  drinks = Object.keys(latestPrices);
+
+  // Keep cached series current so rotating charts needs no refetch
+  Object.entries(changed).forEach(([name, price]) => {
+    if (historyCache[name]) {
+      historyCache[name] = [ ...historyCache[name], { timestamp: tick.timestamp, price } ].slice(-MAX_HISTORY);
+    }
+  });
+  if (chartInitialized && changed[activeDrink] !== undefined && isMarketOpenET()) {
+    appendToChart(activeDrink, changed[activeDrink]);
+  }
+
+  if (Object.keys(changed).length > 0) {
+    updateTicker(latestPrices);
+    updateGrid(latestPrices);
+    previousPrices = { ...latestPrices };
+  }
+  if (tick.purchases && tick.purchases.length > 0) {
+    renderPurchases(tick.purchases);
+  }
+}
+
+function connectStream() {
+  if (!window.EventSource) return; // old browser → keep polling
+  const source = new EventSource("/stream");
+  source.onopen = () => { streamLive = true; };
+  source.onerror = () => {
+    streamLive = false; // EventSource reconnects by itself after a dropped connection…
+    if (source.readyState === EventSource.CLOSED) {
+      // …but not after an error status (503: the server is at its stream
+      // limit), so poll for a while and then try again
+      setTimeout(connectStream, 60000 + Math.random() * 30000);
+    }
+  };
+  source.addEventListener("tick", (e) => applyTick(JSON.parse(e.data)));
+}
+
 // ─── INITIAL KICKOFF ────────────────────────────────────────────────────────────
-// Run once immediately, then every 10 seconds
-updateDashboard();
+// Cold-start from /snapshot, then let /stream push updates; the 10-second loop
+// keeps rotating the chart and falls back to polling if the stream drops.
+updateDashboard().then(connectStream);
 setInterval(updateDashboard, 10000);
 
 
@@ -0,0 +1,762 @@
+"""
+SQLite storage shared by the web tier and the pricing engine.
+
+  • The schema is versioned (``schema_version``) and created lazily: the
+    first ``reader()``/``writer()`` in a process applies any pending
+    MIGRATIONS, so importing this module never touches the disk.
+    ``python storage.py migrate`` does the same ahead of time.
+  • The database runs in WAL mode, so dashboard reads never block the
+    engine's writes (and vice versa).  ``synchronous=NORMAL`` is safe with
+    WAL and avoids an fsync on every commit.
+  • Every process (the engine and each web worker) keeps one long-lived
+    writer connection per database file (``writer``); its writes are
+    serialized per file by ``_write_lock``.  The engine commits each
+    pricing cycle as a single transaction (``record_cycle``); web workers
+    write the webhook inbox, ``webhook_events`` and Square purchases.
+  • Web workers reuse one query-only connection per thread (``reader``)
+    instead of opening a new connection per request.
+  • ``latest_prices`` is the engine → web price bus: one row per drink,
+    updated with every cycle.  ``engine_status`` holds one row per
+    location the engine scheduler drives (always in the main DB_PATH file).
+  • Rows are partitioned by ``market_day`` (the Eastern date a session
+    opened).  Starting a new day just means writing a new value; days older
+    than RETENTION_DAYS are archived to ARCHIVE_DIR and removed in the
+    background by ``run_maintenance``.
+  • Purchases come from the engine (``record_cycle``) or from Square
+    webhooks (``record_webhook_events``, source 'square'), the latter
+    idempotent by event id and by (order_id, drink).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+log = logging.getLogger("storage")
+
+DB_PATH = os.getenv("DB_PATH", os.path.join(os.path.dirname(__file__), "price_history.db"))
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "archive"))
+# Market days kept in the live database before being archived
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 7))
+
+BUSY_TIMEOUT_MS = 5000
+
+# Candle sizes kept by the engine, in seconds, keyed by their API name
+CANDLE_INTERVALS = {"1m": 60, "5m": 300, "15m": 900}
+
+# Bumped by every entry appended to MIGRATIONS (bottom of this section)
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+);
+"""
+
+BASE_TABLES = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    drink TEXT NOT NULL,
+    price REAL NOT NULL,
+    market_day TEXT
+);
+
+CREATE TABLE IF NOT EXISTS purchases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    drink TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL,
+    market_day TEXT
+);
+"""
+
+CANDLES_TABLE = """
+-- Rolled-up price candles, maintained incrementally by record_cycle().
+-- interval is in seconds; bucket is the UTC ISO start of the candle;
+-- volume is units purchased in the bucket.
+CREATE TABLE IF NOT EXISTS candles (
+    market_day TEXT NOT NULL,
+    drink TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    bucket TEXT NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (market_day, drink, interval, bucket)
+) WITHOUT ROWID;
+"""
+
+LATEST_PRICES_TABLE = """
+-- The engine's price bus: the newest price per drink, written in the same
+-- transaction as the cycle, so the web tier never has to ask Square.
+CREATE TABLE IF NOT EXISTS latest_prices (
+    drink TEXT PRIMARY KEY,
+    price REAL NOT NULL,
+    previous REAL,
+    updated_at TEXT NOT NULL,
+    market_day TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+ENGINE_STATUS_TABLE = """
+-- Scheduler heartbeat, one row per location (see scheduler.py).
+CREATE TABLE IF NOT EXISTS engine_status (
+    location TEXT PRIMARY KEY,
+    state TEXT NOT NULL,              -- starting | open | closed | error
+    timezone TEXT,
+    market_day TEXT,
+    ticks INTEGER NOT NULL DEFAULT 0,
+    missed_ticks INTEGER NOT NULL DEFAULT 0,
+    last_tick_at TEXT,
+    next_tick_at TEXT,
+    last_cycle_ms REAL,
+    last_error TEXT,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+ENGINE_STATE_TABLE = """
+-- Engine checkpoint, one row per location, written with every cycle so a
+-- restart resumes (and back-fills missed ticks) from the last tick.
+-- state is JSON: {"prices": {…}, "streaks": {…}, "rng": {…}}.
+CREATE TABLE IF NOT EXISTS engine_state (
+    location TEXT PRIMARY KEY,
+    market_day TEXT NOT NULL,
+    last_tick_at TEXT NOT NULL,
+    state TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+WEBHOOK_EVENTS_TABLE = """
+-- Square webhook event ids already stored (deliveries are at-least-once)
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    received_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_webhook_events_received ON webhook_events (received_at);
+-- payment.created and order.updated describe the same sale: one row per order line
+CREATE UNIQUE INDEX IF NOT EXISTS idx_purchases_order_drink ON purchases (order_id, drink)
+    WHERE order_id IS NOT NULL;
+"""
+
+WEBHOOK_INBOX_TABLE = """
+-- Acknowledged Square webhook events not yet resolved into purchases (in
+-- DB_PATH): kept until stored, retried at next_attempt_at after a failure.
+CREATE TABLE IF NOT EXISTS webhook_inbox (
+    event_id TEXT PRIMARY KEY,
+    received_at TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_webhook_inbox_due ON webhook_inbox (next_attempt_at);
+"""
+
+DEMAND_INDEX = """
+-- Covering index for the engine's demand warm-up (recent_purchases)
+CREATE INDEX IF NOT EXISTS idx_purchases_day_ts ON purchases (market_day, timestamp, drink, quantity, source);
+"""
+
+# Created after the market_day columns exist (older files gain them in a migration)
+INDEXES = """
+-- Covering index: /history/<drink> for one day is answered from the index alone.
+CREATE INDEX IF NOT EXISTS idx_history_day_drink_ts ON history (market_day, drink, timestamp, price);
+DROP INDEX IF EXISTS idx_history_drink_ts;
+CREATE INDEX IF NOT EXISTS idx_purchases_day ON purchases (market_day);
+"""
+
+# Backfill for rows written before market_day existed.  Sessions run
+# 4 PM–midnight Eastern, so shifting UTC back 5 hours lands on the Eastern
+# date in both EST and EDT.
+BACKFILL_MARKET_DAY = "UPDATE {table} SET market_day = date(timestamp, '-5 hours') WHERE market_day IS NULL"
+
+UPSERT_LATEST_PRICE = """
+INSERT INTO latest_prices (drink, price, updated_at, market_day)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (drink) DO UPDATE SET
+    previous   = latest_prices.price,
+    price      = excluded.price,
+    updated_at = excluded.updated_at,
+    market_day = excluded.market_day
+"""
+
+UPSERT_ENGINE_STATE = """
+INSERT INTO engine_state (location, market_day, last_tick_at, state)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (location) DO UPDATE SET
+    market_day   = excluded.market_day,
+    last_tick_at = excluded.last_tick_at,
+    state        = excluded.state
+"""
+
+UPSERT_CANDLE_PRICE = """
+INSERT INTO candles (market_day, drink, interval, bucket, open, high, low, close)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (market_day, drink, interval, bucket) DO UPDATE SET
+    open  = COALESCE(candles.open, excluded.open),
+    high  = MAX(COALESCE(candles.high, excluded.high), excluded.high),
+    low   = MIN(COALESCE(candles.low, excluded.low), excluded.low),
+    close = excluded.close
+"""
+
+UPSERT_CANDLE_VOLUME = """
+INSERT INTO candles (market_day, drink, interval, bucket, volume)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (market_day, drink, interval, bucket) DO UPDATE SET
+    volume = candles.volume + excluded.volume
+"""
+
+ENGINE_STATUS_COLUMNS = (
+    "state", "timezone", "market_day", "ticks", "missed_ticks",
+    "last_tick_at", "next_tick_at", "last_cycle_ms", "last_error",
+)
+
+_local = threading.local()
+_writers = {}       # { db path: connection }
+_write_locks = {}   # { db path: lock held by its writes and its first open }
+_writers_lock = threading.Lock()   # guards the two dicts only, never held across I/O
+
+
+def connect(path=None, readonly=False):
+    """Open a tuned connection; ``readonly`` connections refuse any write."""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+# ─── SCHEMA / MIGRATIONS ───────────────────────────────────────────────────────
+def _run_script(conn, script):
+    """Run ``script`` statement by statement (executescript() would COMMIT)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+
+
+def _add_market_day(conn):
+    for table in ("history", "purchases"):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "market_day" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN market_day TEXT")
+            conn.execute(BACKFILL_MARKET_DAY.format(table=table))
+    _run_script(conn, INDEXES)
+
+
+def _add_webhooks(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(purchases)")}
+    if "order_id" not in columns:
+        conn.execute("ALTER TABLE purchases ADD COLUMN order_id TEXT")
+    if "source" not in columns:
+        conn.execute("ALTER TABLE purchases ADD COLUMN source TEXT NOT NULL DEFAULT 'engine'")
+    _run_script(conn, WEBHOOK_EVENTS_TABLE)
+
+
+def _add_candles(conn):
+    _run_script(conn, CANDLES_TABLE)
+    # Build candles for data written before the table existed
+    if conn.execute("SELECT 1 FROM candles LIMIT 1").fetchone() is None:
+        rebuild_candles(conn)
+
+
+# (version, description, step): step is SQL or a callable taking the connection.
+# Every step is idempotent, so files created before versioning upgrade cleanly.
+MIGRATIONS = [
+    (1, "history and purchases", BASE_TABLES),
+    (2, "market_day partitioning and covering indexes", _add_market_day),
+    (3, "OHLCV candles", _add_candles),
+    (4, "latest_prices bus", LATEST_PRICES_TABLE),
+    (5, "engine_status", ENGINE_STATUS_TABLE),
+    (6, "engine_state checkpoints", ENGINE_STATE_TABLE),
+    (7, "Square webhook purchases", _add_webhooks),
+    (8, "purchases (market_day, timestamp) index", DEMAND_INDEX),
+    (9, "webhook inbox", WEBHOOK_INBOX_TABLE),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# How long a process waits for another one that is migrating the same file
+MIGRATION_LOCK_TIMEOUT_MS = 60000
+
+_ready = set()   # db paths already at SCHEMA_VERSION in this process
+
+
+def schema_version(conn):
+    """The newest migration applied to ``conn``'s file (0 for a new file)."""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def init_schema(conn=None, path=None):
+    """
+    Apply pending migrations and switch the file to WAL (idempotent).
+    Migrations run inside one ``BEGIN IMMEDIATE`` transaction, so when the
+    engine and several workers start together exactly one of them migrates
+    and the others wait, then find nothing left to do.
+    """
+    own = conn is None
+    conn = conn or connect(path)
+    try:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return
+        # Only takes effect on a brand-new file; lets maintenance shrink it later
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT_MS}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _run_script(conn, SCHEMA_VERSION_TABLE)
+            current = schema_version(conn)
+            for version, description, step in MIGRATIONS:
+                if version <= current:
+                    continue
+                if callable(step):
+                    step(conn)
+                else:
+                    _run_script(conn, step)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now(timezone.utc).isoformat())
+                )
+                log.info("Applied migration %d: %s", version, description)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    finally:
+        if own:
+            conn.close()
+
+
+def ensure_schema(path=None):
+    """``init_schema(path)`` at most once per process and file; cheap afterwards."""
+    path = path or DB_PATH
+    if path not in _ready:
+        init_schema(path=path)
+        _ready.add(path)
+
+
+def schema_ready(path=None):
+    """True when ``path`` exists and is at SCHEMA_VERSION (never writes)."""
+    path = path or DB_PATH
+    if not os.path.exists(path):
+        return False
+    conn = connect(path, readonly=True)
+    try:
+        return schema_version(conn) >= SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def _write_lock(path=None):
+    """
+    The lock serializing writes to one database file, so a location whose
+    file is busy (or still migrating) never holds up another's commit.
+    """
+    path = path or DB_PATH
+    with _writers_lock:
+        lock = _write_locks.get(path)
+        if lock is None:
+            lock = _write_locks[path] = threading.Lock()
+        return lock
+
+
+def writer(path=None):
+    """
+    This process's writer connection for ``path``, shared by its threads;
+    hold ``_write_lock(path)`` around every write transaction on it.
+    """
+    path = path or DB_PATH
+    conn = _writers.get(path)
+    if conn is None:
+        with _write_lock(path):
+            conn = _writers.get(path)
+            if conn is None:
+                ensure_schema(path)
+                conn = connect(path)
+                with _writers_lock:
+                    _writers[path] = conn
+    return conn
+
+
+def reader():
+    """A query-only connection reused by the calling thread."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        ensure_schema()
+        conn = connect(readonly=True)
+        _local.conn = conn
+    return conn
+
+
+def market_day_for(now_eastern):
+    """The market day a moment in Eastern time belongs to (its ISO date)."""
+    return now_eastern.date().isoformat()
+
+
+def current_market_day(conn):
+    """The newest market day with any history (index lookup), or None."""
+    return conn.execute("SELECT MAX(market_day) FROM history").fetchone()[0]
+
+
+def record_cycle(market_day, history_rows, purchase_rows=(), path=None, checkpoint=None):
+    """
+    Write one pricing cycle atomically (to ``path``, default DB_PATH).
+      history_rows:  [(timestamp, drink_key, price), …]
+      purchase_rows: [(timestamp, drink_key, quantity, total_price), …]
+      checkpoint:    (location, last_tick_at, state_dict) or None
+    """
+    conn = writer(path)
+    with _write_lock(path), conn:
+        if purchase_rows:
+            conn.executemany(
+                "INSERT INTO purchases (timestamp, drink, quantity, price, market_day) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [row + (market_day,) for row in purchase_rows]
+            )
+        conn.executemany(
+            "INSERT INTO history (timestamp, drink, price, market_day) VALUES (?, ?, ?, ?)",
+            [row + (market_day,) for row in history_rows]
+        )
+        conn.executemany(
+            UPSERT_LATEST_PRICE,
+            [(drink, price, ts, market_day) for ts, drink, price in history_rows]
+        )
+        update_candles(conn, market_day, history_rows, purchase_rows)
+        if checkpoint is not None:
+            location, last_tick_at, state = checkpoint
+            conn.execute(UPSERT_ENGINE_STATE,
+                         (location, market_day, last_tick_at, json.dumps(state, separators=(",", ":"))))
+
+
+def inbox_add(events, path=None):
+    """Keep ``[(event_id, received_at, payload_json), …]`` until resolved (due now)."""
+    conn = writer(path)
+    with _write_lock(path), conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO webhook_inbox (event_id, received_at, payload, next_attempt_at) "
+            "VALUES (?, ?, ?, ?)",
+            [(event_id, received_at, payload, received_at) for event_id, received_at, payload in events]
+        )
+
+
+def inbox_due(now, limit, path=None):
+    """``(event_id, received_at, payload_json, attempts)`` due at ``now`` (ISO UTC), oldest first."""
+    return writer(path).execute(
+        "SELECT event_id, received_at, payload, attempts FROM webhook_inbox "
+        "WHERE next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+        (now, limit)
+    ).fetchall()
+
+
+def inbox_resolve(done=(), retry=(), path=None):
+    """Drop resolved event ids; reschedule ``retry`` = ``[(event_id, next_attempt_at), …]``."""
+    conn = writer(path)
+    with _write_lock(path), conn:
+        conn.executemany("DELETE FROM webhook_inbox WHERE event_id = ?", [(e,) for e in done])
+        conn.executemany(
+            "UPDATE webhook_inbox SET attempts = attempts + 1, next_attempt_at = ? WHERE event_id = ?",
+            [(at, event_id) for event_id, at in retry]
+        )
+
+
+def record_webhook_events(events, path=None):
+    """
+    Store a batch of Square webhook events in one transaction.
+      events: [(event_id, event_type, received_at, purchase_rows), …] with
+      purchase_rows [(market_day, timestamp, drink_key, quantity, total_price, order_id), …]
+    Events whose id is already stored are skipped, and so are order lines
+    already recorded by another event.  Returns the purchase rows inserted.
+    """
+    conn = writer(path)
+    inserted = []
+    with _write_lock(path), conn:
+        for event_id, event_type, received_at, rows in events:
+            if not conn.execute(
+                "INSERT OR IGNORE INTO webhook_events (event_id, event_type, received_at) VALUES (?, ?, ?)",
+                (event_id, event_type, received_at)
+            ).rowcount:
+                continue
+            for day, ts, drink, qty, total, order_id in rows:
+                if conn.execute(
+                    "INSERT OR IGNORE INTO purchases "
+                    "(timestamp, drink, quantity, price, market_day, order_id, source) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'square')",
+                    (ts, drink, qty, total, day, order_id)
+                ).rowcount:
+                    inserted.append((day, ts, drink, qty, total, order_id))
+        by_day = {}
+        for day, ts, drink, qty, total, _order_id in inserted:
+            by_day.setdefault(day, []).append((ts, drink, qty, total))
+        for day, rows in by_day.items():
+            update_candles(conn, day, (), rows)
+    return inserted
+
+
+def square_sales_since(conn, after_id, since=""):
+    """
+    Units of each drink sold through Square (webhooks) in purchases newer
+    than ``after_id`` and timestamped at or after ``since`` (ISO UTC):
+    ``({drink_key: quantity}, newest_id)``.  ``newest_id`` also passes the
+    older rows, so they are never counted later.  A primary key range scan.
+    """
+    sold = {}
+    newest = after_id
+    for pid, ts, drink, qty in conn.execute(
+        "SELECT id, timestamp, drink, quantity FROM purchases WHERE id > ? AND source = 'square'", (after_id,)
+    ):
+        if ts >= since:
+            sold[drink] = sold.get(drink, 0) + qty
+        newest = max(newest, pid)
+    return sold, newest
+
+
+def recent_purchases(conn, market_day, since):
+    """
+    ``(id, timestamp, drink_key, quantity, source)`` for one market day's
+    purchases at or after ``since`` (ISO UTC), oldest first.  A range read
+    of the (market_day, timestamp) covering index.
+    """
+    return conn.execute(
+        "SELECT id, timestamp, drink, quantity, source FROM purchases "
+        "WHERE market_day = ? AND timestamp >= ? ORDER BY timestamp",
+        (market_day, since)
+    ).fetchall()
+
+
+def max_purchase_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM purchases").fetchone()[0]
+
+
+def load_engine_state(location, path=None):
+    """
+    The last checkpoint written for ``location``:
+    ``{"market_day", "last_tick_at", "prices", "streaks", "rng", "sales_cursor"}``,
+    or None.
+    """
+    row = writer(path).execute(
+        "SELECT market_day, last_tick_at, state FROM engine_state WHERE location = ?", (location,)
+    ).fetchone()
+    if row is None:
+        return None
+    market_day, last_tick_at, state = row
+    try:
+        state = json.loads(state)
+    except ValueError:
+        log.warning("Ignoring unreadable checkpoint for %s", location)
+        return None
+    return {"market_day": market_day, "last_tick_at": last_tick_at, **state}
+
+
+def latest_prices(conn):
+    """
+    The engine's newest prices: ``{drink_key: (price, previous, updated_at)}``.
+    ``previous`` is the price one cycle earlier (None for a drink's first cycle).
+    """
+    return {
+        drink: (price, previous, updated_at)
+        for drink, price, previous, updated_at in conn.execute(
+            "SELECT drink, price, previous, updated_at FROM latest_prices"
+        )
+    }
+
+
+def set_engine_status(location, state, **fields):
+    """Upsert ``location``'s scheduler status; ``fields`` are ENGINE_STATUS_COLUMNS."""
+    unknown = set(fields) - set(ENGINE_STATUS_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown engine_status columns: {sorted(unknown)}")
+    fields["state"] = state
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    columns = ", ".join(fields)
+    marks = ", ".join("?" for _ in fields)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in fields)
+    conn = writer()
+    with _write_lock(), conn:
+        conn.execute(
+            f"INSERT INTO engine_status (location, {columns}) VALUES (?, {marks}) "
+            f"ON CONFLICT (location) DO UPDATE SET {updates}",
+            (location, *fields.values())
+        )
+
+
+def engine_status(conn):
+    """Every location's scheduler status as a list of dicts, by location."""
+    cur = conn.execute("SELECT * FROM engine_status ORDER BY location")
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+# ─── CANDLES ───────────────────────────────────────────────────────────────────
+def candle_bucket(timestamp, seconds):
+    """UTC ISO start of the ``seconds``-wide candle containing ``timestamp``."""
+    epoch = datetime.fromisoformat(timestamp).timestamp()
+    start = epoch - epoch % seconds
+    return datetime.fromtimestamp(start, tz=timezone.utc).isoformat()
+
+
+def update_candles(conn, market_day, history_rows, purchase_rows=()):
+    """Fold new history (price) and purchase (volume) rows into every candle size."""
+    price_rows = []
+    for ts, drink, price in history_rows:
+        for seconds in CANDLE_INTERVALS.values():
+            bucket = candle_bucket(ts, seconds)
+            price_rows.append((market_day, drink, seconds, bucket, price, price, price, price))
+    volume_rows = []
+    for ts, drink, qty, _total in purchase_rows:
+        for seconds in CANDLE_INTERVALS.values():
+            volume_rows.append((market_day, drink, seconds, candle_bucket(ts, seconds), qty))
+
+    if volume_rows:
+        conn.executemany(UPSERT_CANDLE_VOLUME, volume_rows)
+    conn.executemany(UPSERT_CANDLE_PRICE, price_rows)
+
+
+def rebuild_candles(conn, market_day=None):
+    """Recompute candles from history/purchases (all days, or one day)."""
+    where, params = ("WHERE market_day = ?", (market_day,)) if market_day else ("", ())
+    conn.execute(f"DELETE FROM candles {where}", params)
+    days = {}
+    for day, ts, drink, price in conn.execute(
+        f"SELECT market_day, timestamp, drink, price FROM history {where} ORDER BY id", params
+    ):
+        days.setdefault(day, ([], []))[0].append((ts, drink, price))
+    for day, ts, drink, qty, total in conn.execute(
+        f"SELECT market_day, timestamp, drink, quantity, price FROM purchases {where} ORDER BY id", params
+    ):
+        days.setdefault(day, ([], []))[1].append((ts, drink, qty, total))
+    for day, (history_rows, purchase_rows) in days.items():
+        update_candles(conn, day, history_rows, purchase_rows)
+
+
+# ─── RETENTION / ARCHIVE ───────────────────────────────────────────────────────
+def archive_day(conn, market_day, archive_dir=None):
+    """
+    Export one market day's history and purchases to compressed files under
+    ``archive_dir`` (Parquet when pyarrow/fastparquet is installed, gzipped
+    CSV otherwise).  Returns the paths written.
+    """
+    import pandas as pd
+
+    archive_dir = archive_dir or ARCHIVE_DIR
+    paths = []
+    for table in ("history", "purchases"):
+        df = pd.read_sql_query(
+            f"SELECT * FROM {table} WHERE market_day = ? ORDER BY id", conn, params=(market_day,)
+        )
+        if df.empty:
+            continue
+        os.makedirs(os.path.join(archive_dir, table), exist_ok=True)
+        base = os.path.join(archive_dir, table, market_day)
+        try:
+            df.to_parquet(base + ".parquet", compression="zstd", index=False)
+            paths.append(base + ".parquet")
+        except ImportError:
+            df.to_csv(base + ".csv.gz", compression="gzip", index=False)
+            paths.append(base + ".csv.gz")
+    return paths
+
+
+def run_maintenance(today, retention_days=None, archive_dir=None, path=None):
+    """
+    Archive and drop every market day older than the retention window, then
+    give the freed pages back to the filesystem.  Meant to run in a
+    background thread while the market is closed; uses its own connection.
+    """
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = (date.fromisoformat(today) - timedelta(days=retention_days)).isoformat()
+
+    conn = connect(path)
+    try:
+        days = [row[0] for row in conn.execute(
+            "SELECT DISTINCT market_day FROM history WHERE market_day < ? "
+            "UNION SELECT DISTINCT market_day FROM purchases WHERE market_day < ?",
+            (cutoff, cutoff)
+        )]
+        for day in days:
+            paths = archive_day(conn, day, archive_dir)
+            with conn:
+                conn.execute("DELETE FROM history WHERE market_day = ?", (day,))
+                conn.execute("DELETE FROM purchases WHERE market_day = ?", (day,))
+                conn.execute("DELETE FROM candles WHERE market_day = ?", (day,))
+            log.info("Archived %s → %s", day, ", ".join(paths) or "nothing to archive")
+        with conn:
+            conn.execute("DELETE FROM webhook_events WHERE received_at < ?", (cutoff,))
+
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Files created before auto_vacuum was set: the mode only takes
+            # effect through a full VACUUM, done once while the market is closed
+            log.info("Converting %s to incremental auto_vacuum (one-time VACUUM)", path or DB_PATH)
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return days
+    finally:
+        conn.close()
+
+
+def purchase_dicts(rows, key_to_display):
+    """
+    Turn ``(id, timestamp, drink_key, quantity, total)`` rows into the JSON
+    shape the dashboard uses.  The engine stores the order total; the
+    dashboard shows the unit price.
+    """
+    return [
+        {
+            "id": pid,
+            "timestamp": ts,
+            "drink": key_to_display.get(key, key),
+            "quantity": qty,
+            "price": round(total / qty, 2) if qty else total,
+        }
+        for pid, ts, key, qty, total in rows
+    ]
+
+
+# ─── CLI ───────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Database schema tools")
+    parser.add_argument("command", choices=("migrate", "check"),
+                        help="migrate: apply pending migrations; check: exit 1 unless up to date")
+    parser.add_argument("--db", default=None, help="database file (default DB_PATH)")
+    parser.add_argument("--wait", type=float, default=0,
+                        help="check: keep polling up to this many seconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        init_schema(path=args.db)
+        print(f"{args.db or DB_PATH}: schema version {SCHEMA_VERSION}")
+        return
+
+    deadline = time.monotonic() + args.wait
+    while not schema_ready(args.db):
+        if time.monotonic() >= deadline:
+            print(f"{args.db or DB_PATH}: not at schema version {SCHEMA_VERSION}")
+            sys.exit(1)
+        time.sleep(0.2)
+    print(f"{args.db or DB_PATH}: ready (schema version {SCHEMA_VERSION})")
+
+
+if __name__ == "__main__":
+    main()
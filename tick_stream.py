@@ -0,0 +1,173 @@
+"""
+Server-Sent Events fan-out for engine ticks.
+
+The pricing engine runs in its own process and only talks to the web tier
+through SQLite (storage.py).  Each gunicorn worker runs one watcher thread
+that checks the newest history/purchase ids once a second (a primary-key
+lookup) and, when the engine has written something new, formats a single
+``tick`` event and hands it to every dashboard connected to that worker.
+
+Threaded servers read a ``queue.Queue`` per dashboard (``subscribe()``);
+the ASGI entry point reads an ``asyncio.Queue`` instead
+(``subscribe_async()``), fed from the watcher thread through its loop.
+
+Event payload::
+
+    {"timestamp": "...", "prices": {"Bud Light": 4.15, …},
+     "purchases": [{id, timestamp, drink, quantity, price}, …]}
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import storage
+
+log = logging.getLogger("tick_stream")
+
+
+class TickBroadcaster:
+    def __init__(self, key_to_display, interval=1.0, backlog=10):
+        self.key_to_display = key_to_display
+        self.interval = interval
+        self.backlog = backlog
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_history_id = None
+        self._last_purchase_id = None
+
+    # ─── SUBSCRIPTIONS ─────────────────────────────────────────────────────────
+    def subscribe(self, limit=0):
+        """
+        Register a dashboard and return the queue its events arrive on, or
+        None if ``limit`` (> 0) dashboards are already connected.
+        """
+        q = queue.Queue(maxsize=self.backlog)
+        return q if self._add(q, limit) else None
+
+    def subscribe_async(self):
+        """Like ``subscribe()``, for a coroutine: read ``sub.queue`` on the running loop."""
+        sub = AsyncSubscriber(asyncio.get_running_loop(), self.backlog)
+        self._add(sub)
+        return sub
+
+    def _add(self, q, limit=0):
+        with self._lock:
+            if limit and len(self._subscribers) >= limit:
+                return False
+            self._subscribers.add(q)
+            if self._thread is None or not self._thread.is_alive():
+                # Started lazily so importing the app never spawns threads
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return True
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, message):
+        """Queue an already-formatted SSE message for every subscriber."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # A stalled client misses this tick; it resyncs on reconnect.
+                pass
+
+    # ─── WATCHER THREAD ────────────────────────────────────────────────────────
+    def _run(self):
+        conn = storage.connect(readonly=True)
+        try:
+            while True:
+                try:
+                    event = self._poll(conn)
+                except sqlite3.Error as e:
+                    log.warning("Poll failed: %s", e)
+                    event = None
+                if event:
+                    self.publish(format_event("tick", event))
+                time.sleep(self.interval)
+        finally:
+            conn.close()
+
+    def _poll(self, conn):
+        """Return a tick payload for rows written since the last poll, or None."""
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM history")
+        max_history = c.fetchone()[0]
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM purchases")
+        max_purchase = c.fetchone()[0]
+
+        # First poll only sets the cursors; clients cold-start over HTTP.
+        if self._last_history_id is None:
+            self._last_history_id = max_history
+            self._last_purchase_id = max_purchase
+            return None
+
+        # Ids only grow (AUTOINCREMENT), so a wiped table never replays rows.
+        if max_history <= self._last_history_id and max_purchase <= self._last_purchase_id:
+            return None
+
+        # Read up to the MAX(id)s above only: rows committed since then are
+        # left for the next poll, which would otherwise send them again.
+        prices = {}
+        timestamp = None
+        if max_history > self._last_history_id:
+            c.execute(
+                "SELECT timestamp, drink, price FROM history WHERE id > ? AND id <= ? ORDER BY id ASC",
+                (self._last_history_id, max_history)
+            )
+            for ts, key, price in c.fetchall():
+                prices[self.key_to_display.get(key, key)] = price
+                timestamp = ts
+
+        purchases = []
+        if max_purchase > self._last_purchase_id:
+            c.execute(
+                "SELECT id, timestamp, drink, quantity, price FROM purchases "
+                "WHERE id > ? AND id <= ? ORDER BY id DESC",
+                (self._last_purchase_id, max_purchase)
+            )
+            purchases = storage.purchase_dicts(c.fetchall(), self.key_to_display)
+
+        self._last_history_id = max_history
+        self._last_purchase_id = max_purchase
+        return {"timestamp": timestamp, "prices": prices, "purchases": purchases}
+
+
+class AsyncSubscriber:
+    """An ``asyncio.Queue`` that the watcher thread can ``put_nowait()`` into."""
+
+    def __init__(self, loop, backlog):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=backlog)
+
+    def put_nowait(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass   # loop closed: the connection is gone
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass   # same as a full queue.Queue: this client misses the tick
+
+
+def format_event(name, payload):
+    """Serialize one SSE message (done once per tick, shared by all clients)."""
+    data = json.dumps(payload, separators=(",", ":"))
+    return f"event: {name}\ndata: {data}\n\n"
@@ -0,0 +1,289 @@
+"""
+Square webhook ingestion behind ``POST /webhooks/square`` (app.py).
+
+  • ``verify_signature()``: Square signs ``notification_url + body`` with the
+    subscription's signature key (HMAC-SHA256, base64) and sends it in the
+    ``x-square-hmacsha256-signature`` header.  Anything else is rejected.
+  • ``payment.created`` and ``order.updated`` (state COMPLETED) both point
+    at an order; its line items for tracked drinks become ``purchases`` rows
+    (source 'square') in the database of the location the order belongs to.
+  • Write-behind: a request only parses and enqueues the event.  One writer
+    thread per worker moves queued events into the ``webhook_inbox`` table,
+    then resolves due inbox events in batches: one ``orders/batch-retrieve``
+    for the orders they need and one transaction per location
+    (``storage.record_webhook_events``).  An event leaves the inbox only
+    once stored; after a failure only that event is retried, with
+    exponential backoff, so an acknowledged event is never lost (even
+    across restarts).  An order Square can't return yet (``payment.created``
+    may arrive before its order is readable) is retried the same way, and
+    an event is dropped only after ``max_attempts`` failures of its own.
+  • Idempotent: an event id is stored once and an order line once, so
+    Square's redeliveries and the payment/order pair for the same sale
+    never double-count.  Orders the pricing engine creates itself carry
+    ``ENGINE_ORDER_REFERENCE`` and are skipped: the engine records those.
+
+A full queue answers 503, so Square redelivers the event later.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import metrics
+import scheduler
+import storage
+from drinks import registry_for
+from square_client import ENGINE_ORDER_REFERENCE
+
+log = logging.getLogger("webhooks")
+
+SIGNATURE_HEADER = "x-square-hmacsha256-signature"
+EVENT_TYPES = ("payment.created", "order.updated")
+
+WEBHOOK_EVENTS = metrics.Counter(
+    "square_webhook_events_total", "Square webhook events by type and outcome.", ("type", "outcome"))
+
+
+def verify_signature(signature_key, notification_url, body, signature):
+    """True if ``signature`` is Square's HMAC of ``notification_url + body``."""
+    if not signature_key or not signature:
+        return False
+    digest = hmac.new(signature_key.encode("utf-8"), notification_url.encode("utf-8") + body,
+                      hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode("ascii"), signature)
+
+
+def _parse_time(value):
+    if not value:
+        return datetime.now(timezone.utc)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+def order_reference(event):
+    """``(order_id, square_location_id)`` an event is about, or None to ignore it."""
+    obj = event.get("data", {}).get("object", {})
+    if event.get("type") == "payment.created":
+        payment = obj.get("payment", {})
+        if payment.get("status") in ("FAILED", "CANCELED"):
+            return None
+        ref = payment.get("order_id"), payment.get("location_id")
+    elif event.get("type") == "order.updated":
+        updated = obj.get("order_updated", {})
+        if updated.get("state") != "COMPLETED":
+            return None
+        ref = updated.get("order_id"), updated.get("location_id")
+    else:
+        return None
+    return ref if ref[0] else None
+
+
+def sale_time(order, event):
+    """
+    When the sale happened: the order's ``closed_at`` once it is closed,
+    else the payment's ``created_at`` for ``payment.created`` (an open tab's
+    order may have been created hours earlier), else the order's or event's.
+    """
+    payment = event.get("data", {}).get("object", {}).get("payment", {}) \
+        if event.get("type") == "payment.created" else {}
+    return _parse_time(order.get("closed_at") or payment.get("created_at")
+                       or order.get("created_at") or event.get("created_at"))
+
+
+class WebhookIngester:
+    def __init__(self, client, batch_size=50, queue_size=1000, backoff=2.0, max_backoff=300.0,
+                 poll_interval=5.0, max_attempts=12):
+        self.client = client
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._locations = None
+
+    # ─── REQUEST SIDE ──────────────────────────────────────────────────────────
+    def submit(self, event):
+        """
+        Queue a verified event for the writer thread.  Returns False if the
+        queue is full (answer 503 so Square retries); events we don't ingest
+        are accepted and dropped.
+        """
+        event_type = event.get("type", "")
+        if event_type not in EVENT_TYPES or not event.get("event_id"):
+            WEBHOOK_EVENTS.inc(type=event_type or "unknown", outcome="ignored")
+            return True
+        self.start()
+        try:
+            self._queue.put_nowait((event, datetime.now(timezone.utc).isoformat()))
+        except queue.Full:
+            WEBHOOK_EVENTS.inc(type=event_type, outcome="rejected")
+            return False
+        return True
+
+    def start(self):
+        """
+        Start this process's writer thread if it isn't running (cheap when it
+        is).  Called per worker, never at import: a thread started in
+        gunicorn's --preload master would not survive the fork.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="webhooks", daemon=True)
+                self._thread.start()
+
+    def backlog(self):
+        """Events queued in memory, not yet in the inbox."""
+        return self._queue.qsize()
+
+    # ─── WRITER THREAD ─────────────────────────────────────────────────────────
+    def _run(self):
+        while True:
+            try:
+                self._persist_queued()
+                while self._resolve_due():
+                    pass
+            except Exception as e:
+                log.error("Webhook writer failed: %s", e)
+                time.sleep(self.poll_interval)
+
+    def _persist_queued(self):
+        """Move queued events into the inbox (waits up to poll_interval for one)."""
+        try:
+            batch = [self._queue.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        storage.inbox_add([(event["event_id"], received_at, json.dumps(event)) for event, received_at in batch])
+
+    def _resolve_due(self):
+        """Resolve one batch of due inbox events; True if there may be more."""
+        now = datetime.now(timezone.utc)
+        due = storage.inbox_due(now.isoformat(), self.batch_size)
+        if not due:
+            return False
+        batch = [(event_id, json.loads(payload), received_at, attempts)
+                 for event_id, received_at, payload, attempts in due]
+        try:
+            retry = self.ingest(batch)
+        except Exception as e:
+            log.warning("Webhook batch of %d failed, kept for retry: %s", len(due), e)
+            retry = {event_id for event_id, *_rest in batch}
+
+        done, rescheduled = [], []
+        for event_id, event, _received, attempts in batch:
+            if event_id not in retry:
+                done.append(event_id)
+                continue
+            WEBHOOK_EVENTS.inc(type=event.get("type", "unknown"), outcome="retry")
+            delay = min(self.backoff * 2 ** attempts, self.max_backoff)
+            rescheduled.append((event_id, (now + timedelta(seconds=delay)).isoformat()))
+        storage.inbox_resolve(done=done, retry=rescheduled)
+        return len(due) == self.batch_size and len(retry) < len(due)
+
+    def ingest(self, batch):
+        """
+        Store ``[(event_id, event, received_at, attempts), …]``: fetch their
+        orders, then write per location.  Returns the ids of the events to
+        retry later (the rest are resolved); raises only if the orders can't
+        be fetched at all.
+        """
+        refs = [order_reference(event) for _event_id, event, _received, _attempts in batch]
+        orders = self.fetch_orders({ref[0] for ref in refs if ref})
+
+        retry = set()
+        per_location = {}   # location name → (Location, [(event_id, type, received_at, rows)])
+        for (event_id, event, received_at, attempts), ref in zip(batch, refs):
+            if ref is None:
+                WEBHOOK_EVENTS.inc(type=event["type"], outcome="ignored")
+                continue
+            try:
+                order = orders.get(ref[0])
+                if order is None:
+                    raise LookupError(f"order {ref[0]} not found (yet)")
+                location = self.location(order.get("location_id") or ref[1])
+                if location is None:
+                    log.warning("Skipping event %s: order %s is not at a known location", event_id, ref[0])
+                    WEBHOOK_EVENTS.inc(type=event["type"], outcome="ignored")
+                    continue
+                rows = [] if order.get("reference_id") == ENGINE_ORDER_REFERENCE else \
+                    self.purchase_rows(order, location, event)
+            except Exception as e:
+                # Only this event backs off; the rest of the batch is stored
+                if self._keep_for_retry(event_id, event, attempts, e):
+                    retry.add(event_id)
+                continue
+            per_location.setdefault(location.name, (location, []))[1].append(
+                (event_id, event["type"], received_at, rows))
+
+        for location, events in per_location.values():
+            try:
+                inserted = storage.record_webhook_events(events, path=location.db_path)
+            except Exception as e:
+                log.warning("[%s] Could not store %d webhook event(s), kept for retry: %s",
+                            location.name, len(events), e)
+                retry.update(event_id for event_id, *_rest in events)
+                continue
+            for _event_id, event_type, _received, _rows in events:
+                WEBHOOK_EVENTS.inc(type=event_type, outcome="processed")
+            if inserted:
+                log.info("[%s] Recorded %d purchase line(s) from Square webhooks", location.name, len(inserted))
+        return retry
+
+    def _keep_for_retry(self, event_id, event, attempts, error):
+        """True to retry a failed event later; False (dropped) once it has failed max_attempts times."""
+        if attempts + 1 < self.max_attempts:
+            log.warning("Event %s failed (attempt %d), kept for retry: %s", event_id, attempts + 1, error)
+            return True
+        log.error("Dropping event %s after %d attempts: %s", event_id, attempts + 1, error)
+        WEBHOOK_EVENTS.inc(type=event.get("type", "unknown"), outcome="failed")
+        return False
+
+    def fetch_orders(self, order_ids):
+        """``{order_id: order}`` for ``order_ids`` (one batch-retrieve).  Raises on failure."""
+        if not order_ids:
+            return {}
+        resp = self.client.post("/orders/batch-retrieve", json={"order_ids": sorted(order_ids)})
+        resp.raise_for_status()
+        return {order["id"]: order for order in resp.json().get("orders", [])}
+
+    def location(self, square_location_id):
+        """The scheduler.Location with this Square location id, or None."""
+        if self._locations is None:
+            try:
+                self._locations = scheduler.load_locations()
+            except (OSError, ValueError) as e:
+                log.error("No locations to ingest webhooks into: %s", e)
+                self._locations = []
+        return next((loc for loc in self._locations if loc.square_location_id == square_location_id), None)
+
+    def purchase_rows(self, order, location, event):
+        """``record_webhook_events`` rows for the tracked drinks in ``order``."""
+        key_by_variation = registry_for(location.drinks_config).view("key_by_variation")
+        sold_at = sale_time(order, event)
+        market_day = location.market_day(sold_at)
+        sold = {}   # one row per drink: the (order_id, drink) pair is unique
+        for li in order.get("line_items", []):
+            key = key_by_variation.get(li.get("catalog_object_id"))
+            if key is None:
+                continue
+            qty = int(float(li.get("quantity", "1")))
+            total = li.get("total_money", {}).get("amount")
+            if total is None:
+                total = li.get("base_price_money", {}).get("amount", 0) * qty
+            prev_qty, prev_total = sold.get(key, (0, 0))
+            sold[key] = (prev_qty + qty, prev_total + total)
+        return [(market_day, sold_at.isoformat(), key, qty, total / 100.0, order["id"])
+                for key, (qty, total) in sold.items()]
@@ -1,2 +1,4 @@
-from app import app
+from app import create_app
+
+app = create_app()
 server = app